@@ -1,26 +1,32 @@
 
-from agents import Agent
+from agents import Agent, ModelSettings
 from app.memory import Memory
-from openai import AsyncOpenAI
 from app.config import env
+from app.client import llm_client
 from agents import set_default_openai_client, set_default_openai_api, set_tracing_disabled
-from app.tool import caption, ocr, localize, qa, time, video_caption, video_qa
+from app.tool import caption, ocr, localize, qa, time, video_caption, video_qa, recall
 
 def build_agent():
-    client = AsyncOpenAI(base_url=env.end_lang,api_key=env.api_key)
-    set_default_openai_client(client=client, use_for_tracing=False)
+    set_default_openai_client(client=llm_client(), use_for_tracing=False)
     set_default_openai_api("chat_completions")
     set_tracing_disabled(disabled=True)
+    tools = [caption, ocr, qa, time, localize, video_caption, video_qa]
+    instructions = (
+        "As a helpful assistant, your functions include answering questions about images, "
+        "Optical Character Recognition (OCR), image caption generation, object localization "
+        "within images, and video caption generation and Q&A. For video-related tools, you "
+        "will need to determine the appropriate time window to analyze from the past. "
+    )
+    if env.index:
+        # recall can only answer from the background index, so offer it only when indexing runs
+        tools.append(recall)
+        instructions += "To find when something was seen further back, use recall. "
     chat_agent = Agent[Memory](
         name="Assistant",
-        tools=[caption, ocr, qa, time, localize, video_caption, video_qa],
+        tools=tools,
         model=env.model_agent,
-        instructions=(
-            "As a helpful assistant, your functions include answering questions about images, "
-            "Optical Character Recognition (OCR), image caption generation, object localization "
-            "within images, and video caption generation and Q&A. For video-related tools, you "
-            "will need to determine the appropriate time window to analyze from the past."
-        ),
+        instructions=instructions + "Independent tools can be called together in one turn.",
+        model_settings=ModelSettings(parallel_tool_calls=env.tool_concurrency > 1),
     )
 
     return chat_agent
@@ -0,0 +1,145 @@
+import bisect
+import itertools
+import mmap
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .config import logger, env
+from .utils import fit
+
+_archive_ids = itertools.count()
+
+
+class FrameArchive:
+    """Per-session on-disk archive of frames that aged out of the ring buffer.
+
+    Frames are downscaled, JPEG-encoded and appended to segment files of
+    ``segment_bytes``; a compact in-memory index (timestamp, segment,
+    offset, length per frame) supports time-window lookups, and segments are
+    read back through ``mmap`` so only the requested frames are touched.
+    Whole segments are dropped once the archive exceeds ``max_bytes`` or
+    their newest frame is older than ``max_age`` seconds; since the newest
+    segment is kept, ``window`` also skips frames older than ``max_age``.
+    """
+
+    def __init__(self, max_bytes: int = env.archive_mb * 2**20, max_age: float = env.archive_max_age,
+                 segment_bytes: int = env.archive_segment_mb * 2**20, max_side: int = env.archive_side,
+                 quality: int = env.archive_quality, interval: float = env.archive_interval) -> None:
+        self.uid: int = next(_archive_ids)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segment_bytes = segment_bytes
+        self.max_side = max_side
+        self.quality = quality
+        self.interval = interval
+        self._root: Optional[Path] = None
+        self._ts = array("d")
+        self._seg = array("l")
+        self._off = array("q")
+        self._len = array("l")
+        self._first: int = 0  # global index of self._ts[0]
+        self._segments: Dict[int, int] = {}  # segment id -> bytes written
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._current: int = 0
+        self._last_ts: float = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._segments.values())
+
+    @property
+    def oldest(self) -> Optional[float]:
+        return self._ts[0] if self._ts else None
+
+    def _path(self, seg: int) -> Path:
+        if self._root is None:
+            self._root = Path(tempfile.mkdtemp(prefix="copilot-archive-", dir=env.archive_dir or None))
+        return self._root / f"seg-{seg:06d}.bin"
+
+    def add(self, frame: np.ndarray, ts: float, keyframe: bool = False) -> bool:
+        """Archive an RGB frame if it is a keyframe or ``interval`` has passed since the last one."""
+        if not keyframe and ts - self._last_ts < self.interval:
+            return False
+        h, w = fit(frame.shape[0], frame.shape[1], self.max_side)
+        small = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA) if (h, w) != frame.shape[:2] else frame
+        ok, buf = cv2.imencode(".jpg", cv2.cvtColor(small, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return False
+        with self._lock:
+            if self._segments.get(self._current, 0) + len(buf) > self.segment_bytes:
+                self._current += 1
+            offset = self._segments.get(self._current, 0)
+            with open(self._path(self._current), "ab") as f:
+                f.write(buf.tobytes())
+            self._segments[self._current] = offset + len(buf)
+            self._ts.append(ts)
+            self._seg.append(self._current)
+            self._off.append(offset)
+            self._len.append(len(buf))
+            self._last_ts = ts
+            self._retain(ts)
+        return True
+
+    def _retain(self, now: float) -> None:
+        while len(self._segments) > 1:
+            oldest = min(self._segments)
+            count = bisect.bisect_right(self._seg, oldest)
+            if self.nbytes <= self.max_bytes and now - self._ts[count - 1] <= self.max_age:
+                break
+            del self._ts[:count], self._seg[:count], self._off[:count], self._len[:count]
+            self._first += count
+            del self._segments[oldest]
+            if (m := self._maps.pop(oldest, None)) is not None:
+                m.close()
+            self._path(oldest).unlink(missing_ok=True)
+
+    def _read(self, i: int) -> bytes:
+        seg, off, length = self._seg[i], self._off[i], self._len[i]
+        m = self._maps.get(seg)
+        if m is None or len(m) < off + length:
+            if m is not None:
+                m.close()
+            with open(self._path(seg), "rb") as f:
+                m = self._maps[seg] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m[off:off + length]
+
+    def window(self, start: float, end: float, limit: int = 0,
+               now: Optional[float] = None) -> List[Tuple[np.ndarray, tuple, float]]:
+        """Decoded ``(frame, key, timestamp)`` for archived frames in ``[start, end)``, at most *limit*, spread evenly."""
+        start = max(start, (time.time() if now is None else now) - self.max_age)
+        with self._lock:
+            lo, hi = bisect.bisect_left(self._ts, start), bisect.bisect_left(self._ts, end)
+            picks = list(range(lo, hi))
+            if limit and len(picks) > limit:
+                picks = [picks[i] for i in np.linspace(0, len(picks) - 1, limit).round().astype(int)]
+            data = [(self._read(i), self._first + i, self._ts[i]) for i in picks]
+        frames = []
+        for buf, index, ts in data:
+            bgr = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+            frames.append((cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), ("archive", self.uid, index), ts))
+        return frames
+
+    def close(self) -> None:
+        with self._lock:
+            for m in self._maps.values():
+                m.close()
+            self._maps.clear()
+            for a in (self._ts, self._seg, self._off, self._len):
+                del a[:]
+            self._segments.clear()
+            if self._root is not None:
+                shutil.rmtree(self._root, ignore_errors=True)
+                logger.debug(f"Removed frame archive {self._root}")
+                self._root = None
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import logger, env
+
+
+class BatchDispatcher:
+    """Coalesces concurrent requests into batched calls.
+
+    Requests are grouped by ``name`` (the model). A group is sent as soon as
+    it holds ``max_batch`` items or ``max_wait`` seconds after its first item
+    arrived, whichever comes first. ``send`` receives the name and the list
+    of payloads and must return one result per payload, in order; each
+    caller gets its own result (or the batch's exception) back.
+
+    Must be used from a single event loop (the shared agent runtime), which
+    is what lets requests from different sessions share a batch.
+    """
+
+    def __init__(self, send: Callable[[str, List[Any]], Awaitable[List[Any]]],
+                 max_batch: int = env.task_batch_size, max_wait: float = env.task_batch_wait) -> None:
+        self.send = send
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self.batches: int = 0
+        self.items: int = 0
+
+    async def submit(self, name: str, payload: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = self._pending.setdefault(name, [])
+        group.append((payload, future))
+        if len(group) >= self.max_batch:
+            self._flush(name)
+        elif name not in self._timers:
+            self._timers[name] = loop.call_later(self.max_wait, self._flush, name)
+        return await future
+
+    def _flush(self, name: str) -> None:
+        timer: Optional[asyncio.TimerHandle] = self._timers.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+        group = [(p, f) for p, f in self._pending.pop(name, []) if not f.cancelled()]
+        if group:
+            asyncio.get_running_loop().create_task(self._dispatch(name, group))
+
+    async def _dispatch(self, name: str, group: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(group)
+        try:
+            results = await self.send(name, [p for p, _ in group])
+            if len(results) != len(group):
+                raise ValueError(f"Batch of {len(group)} returned {len(results)} results")
+        except Exception as exc:  # noqa: BLE001
+            logger.debug(f"Batch {name} x{len(group)} failed: {exc}")
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,91 @@
+import itertools
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+from .cache import LRUCache
+from .config import logger, env
+from .utils import fit
+
+_blob_ids = itertools.count()
+
+
+@dataclass
+class Blob:
+    id: str
+    path: str    # compressed full-size image
+    thumb: str   # small version shown in the chat
+    nbytes: int
+
+
+class BlobStore:
+    """Bounded per-session store of compressed snapshot images.
+
+    Images are written once as WebP/JPEG files under a private temp
+    directory (which Gradio is allowed to serve) and referenced from the chat
+    by path, so the history never carries raw arrays. When the store exceeds
+    ``max_bytes`` or ``max_items`` the oldest blobs are deleted and
+    ``on_expire`` is called with their id.
+    """
+
+    def __init__(self, max_bytes: int = env.blob_store_mb * 2**20, max_items: int = env.blob_store_items,
+                 on_expire: Optional[Callable[[str], None]] = None) -> None:
+        self.on_expire = on_expire
+        self._root: Optional[Path] = None
+        self._blobs = LRUCache(max_bytes=max_bytes, max_items=max_items, sizeof=lambda b: b.nbytes, on_evict=self._evicted)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    @property
+    def nbytes(self) -> int:
+        return self._blobs.nbytes
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            self._root = Path(tempfile.mkdtemp(prefix="copilot-blobs-", dir=env.blob_dir or None))
+        return self._root
+
+    def _write(self, name: str, image: np.ndarray, max_side: int = 0) -> tuple[str, int]:
+        h, w = fit(image.shape[0], image.shape[1], max_side)
+        if (h, w) != image.shape[:2]:
+            image = cv2.resize(image, (w, h), interpolation=cv2.INTER_AREA)
+        ext = ".webp" if env.blob_format == "webp" else ".jpg"
+        flag = cv2.IMWRITE_WEBP_QUALITY if ext == ".webp" else cv2.IMWRITE_JPEG_QUALITY
+        ok, buf = cv2.imencode(ext, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [flag, env.blob_quality])
+        if not ok:
+            raise ValueError("Encoding failed")
+        path = self.root / f"{name}{ext}"
+        path.write_bytes(buf.tobytes())
+        return str(path), len(buf)
+
+    def put(self, image: np.ndarray) -> Blob:
+        """Compress an RGB image (and its thumbnail) into the store."""
+        blob_id = f"b{next(_blob_ids)}"
+        path, size = self._write(blob_id, image)
+        thumb, thumb_size = self._write(f"{blob_id}-thumb", image, env.blob_thumb)
+        blob = Blob(blob_id, path, thumb, size + thumb_size)
+        self._blobs.put(blob_id, blob)
+        return blob
+
+    def get(self, blob_id: str) -> Optional[Blob]:
+        return self._blobs.get(blob_id)
+
+    def _evicted(self, blob_id: str, blob: Blob) -> None:
+        for path in (blob.path, blob.thumb):
+            Path(path).unlink(missing_ok=True)
+        if self.on_expire:
+            self.on_expire(blob_id)
+
+    def close(self) -> None:
+        self._blobs.clear()
+        if self._root is not None:
+            shutil.rmtree(self._root, ignore_errors=True)
+            logger.debug(f"Removed blob store {self._root}")
+            self._root = None
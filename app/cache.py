@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from .config import env
+
+
+class LRUCache:
+    """Thread-safe LRU map bounded by entry count and by total ``sizeof`` bytes."""
+
+    def __init__(self, max_bytes: int = 0, max_items: int = 0, sizeof: Callable[[Any], int] = lambda v: 0,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None) -> None:
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.nbytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self.sizeof(self._items.pop(key))
+            self._items[key] = value
+            self.nbytes += size
+            while self._items and (
+                (self.max_bytes and self.nbytes > self.max_bytes)
+                or (self.max_items and len(self._items) > self.max_items)
+            ):
+                old_key, old = self._items.popitem(last=False)
+                self.nbytes -= self.sizeof(old)
+                if self.on_evict:
+                    self.on_evict(old_key, old)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return default
+            value = self._items.pop(key)
+            self.nbytes -= self.sizeof(value)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def get_or_put(self, key: Optional[Hashable], make: Callable[[], Any]) -> Any:
+        """Return the cached value for *key*, building it with *make* on a miss.
+
+        A ``None`` key bypasses the cache entirely.
+        """
+        if key is None:
+            return make()
+        value = self.get(key)
+        if value is None:
+            value = make()
+            self.put(key, value)
+        return value
+
+    def stats(self) -> dict:
+        return {"items": len(self._items), "bytes": self.nbytes, "hits": self.hits, "misses": self.misses}
+
+
+class ResultCache:
+    """Tool results matched by perceptual hash of the frame they were computed on.
+
+    Entries are keyed by ``(session, tool, normalized question)``; a lookup
+    hits when an entry for the same key is younger than ``ttl`` seconds and
+    its frame hash is within ``threshold`` bits (Hamming distance) of the
+    current frame's. At most ``max_items`` results are kept, evicting the
+    least recently used first.
+    """
+
+    def __init__(self, threshold: int = env.result_cache_distance, ttl: float = env.result_cache_ttl,
+                 max_items: int = env.result_cache_items) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self.hits: int = 0
+        self.misses: int = 0
+        # (session, tool, question, phash) -> (timestamp, result), in LRU order
+        self._items: "OrderedDict[tuple, tuple[float, Any]]" = OrderedDict()
+        # (session, tool, question) -> phashes stored for it
+        self._hashes: dict[tuple, set[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(question.lower().split()).rstrip("?.!")
+
+    def get(self, session: Hashable, tool: str, question: str, phash: int, count: bool = True) -> Any:
+        now = time.time()
+        prefix = (session, tool, self.normalize(question))
+        with self._lock:
+            best = None
+            for h in self._hashes.get(prefix, ()):
+                distance = (h ^ phash).bit_count()
+                if distance <= self.threshold and (best is None or distance < best[0]):
+                    if now - self._items[(*prefix, h)][0] <= self.ttl:
+                        best = (distance, h)
+            if best is None:
+                self.misses += count
+                return None
+            key = (*prefix, best[1])
+            self._items.move_to_end(key)
+            self.hits += count
+            return self._items[key][1]
+
+    def put(self, session: Hashable, tool: str, question: str, phash: int, result: Any, ts: Optional[float] = None) -> None:
+        prefix = (session, tool, self.normalize(question))
+        with self._lock:
+            self._items.pop((*prefix, phash), None)
+            self._items[(*prefix, phash)] = (time.time() if ts is None else ts, result)
+            self._hashes.setdefault(prefix, set()).add(phash)
+            while len(self._items) > self.max_items:
+                self._remove(next(iter(self._items)))
+
+    def _remove(self, key: tuple) -> None:
+        del self._items[key]
+        hashes = self._hashes[key[:3]]
+        hashes.discard(key[3])
+        if not hashes:
+            del self._hashes[key[:3]]
+
+    def drop(self, session: Hashable) -> None:
+        """Forget every result of *session*."""
+        with self._lock:
+            for key in [k for k in self._items if k[0] == session]:
+                self._remove(key)
+
+    def stats(self) -> dict:
+        return {"items": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+# Shared by every session; entries are namespaced by session so results never cross users
+result_cache = ResultCache()
@@ -0,0 +1,38 @@
+import importlib.util
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from .config import env
+
+_http: Optional[httpx.AsyncClient] = None
+_llm: Dict[str, AsyncOpenAI] = {}
+
+
+def http_client() -> httpx.AsyncClient:
+    """Process-wide pooled HTTP client (keep-alive, HTTP/2 when ``h2`` is installed).
+
+    The pool is bound to the event loop it is first used on, which is the
+    shared agent runtime.
+    """
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            http2=env.http2 and importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=env.http_max_connections,
+                max_keepalive_connections=env.http_max_keepalive,
+                keepalive_expiry=env.http_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(env.http_timeout, connect=env.http_connect_timeout),
+        )
+    return _http
+
+
+def llm_client(base_url: str = "") -> AsyncOpenAI:
+    """Shared async OpenAI-compatible client for the agent and the tools, per endpoint (END_LANG by default)."""
+    base_url = base_url or env.end_lang
+    if base_url not in _llm:
+        _llm[base_url] = AsyncOpenAI(base_url=base_url, api_key=env.api_key, http_client=http_client())
+    return _llm[base_url]
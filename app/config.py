@@ -18,6 +18,7 @@ class Envs:
         self.api_key = os.getenv("API_KEY")
         self.end_task = os.getenv("END_TASK")
         self.end_lang = os.getenv("END_LANG")
+        self.end_task_batch = os.getenv("END_TASK_BATCH")
         self.model_agent = os.getenv("MODEL_AGENT")
         self.model_mllm = os.getenv("MODEL_MLLM")
         self.model_loc = os.getenv("MODEL_LOC")
@@ -30,7 +31,125 @@ class Envs:
             print("WARNING: OpenAI client not initialized due to missing environment variables")
             
         self.debug = os.getenv("DEBUG", "1").lower() in ("true", "1", "yes")
+        # Prometheus text metrics on http://host:METRICS_PORT/metrics (and JSON on /summary), 0 disables
+        self.metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        # Record every session's frames and chat inputs here, for offline replay (see app/replay.py)
+        self.record_dir = os.getenv("RECORD_DIR", "")
         self.fps = int(os.getenv("FPS"))
+
+        # Session lifecycle
+        self.session_ttl = float(os.getenv("SESSION_TTL", "120"))
+        self.max_sessions = int(os.getenv("MAX_SESSIONS", "64"))
+        self.max_frame_mb = int(os.getenv("MAX_FRAME_MB", "8192"))
+        self.agent_workers = int(os.getenv("AGENT_WORKERS", "8"))
+        self.tool_concurrency = int(os.getenv("TOOL_CONCURRENCY", "4"))
+        # What a message sent while the agent is busy does: queue, replace (cancel the current run) or reject
+        self.run_policy = os.getenv("RUN_POLICY", "queue").lower()
+        if self.run_policy not in ("queue", "replace", "reject"):
+            raise ValueError(f"RUN_POLICY must be queue, replace or reject, not {self.run_policy!r}")
+        self.run_timeout = float(os.getenv("RUN_TIMEOUT", "120"))
+        self.tool_timeout = float(os.getenv("TOOL_TIMEOUT", "45"))
+
+        # Stream the agent's answer into the chat as it is generated
+        self.stream = os.getenv("STREAM", "1").lower() in ("true", "1", "yes")
+        self.stream_interval = float(os.getenv("STREAM_INTERVAL", "0.05"))
+        # The agent model's chat template opens <think> itself, so its output starts inside the reasoning
+        self.think_open = os.getenv("THINK_OPEN", "0").lower() in ("true", "1", "yes")
+
+        # Micro-batching of localization requests (used when END_TASK_BATCH is set)
+        self.task_batch_size = int(os.getenv("TASK_BATCH_SIZE", "8"))
+        self.task_batch_wait = float(os.getenv("TASK_BATCH_WAIT", "0.02"))
+
+        # Admission control toward END_LANG and END_TASK, e.g. LIMIT_LANG="concurrency=16,rate=20,queue=64,wait=10"
+        self.limit_lang = os.getenv("LIMIT_LANG", "")
+        self.limit_task = os.getenv("LIMIT_TASK", "")
+
+        # Retries, hedging and alternate routes for MLLM and detector requests
+        self.retry_attempts = int(os.getenv("RETRY_ATTEMPTS", "3"))
+        self.retry_deadline = float(os.getenv("RETRY_DEADLINE", "40"))
+        self.retry_backoff = float(os.getenv("RETRY_BACKOFF", "0.2"))
+        self.hedge = os.getenv("HEDGE", "0").lower() in ("true", "1", "yes")
+        self.hedge_quantile = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+        self.hedge_min_delay = float(os.getenv("HEDGE_MIN_DELAY", "0.1"))
+        # Per-tool alternates, e.g. ALTERNATES_QA="small-vl,@http://replica-2:8000/v1"
+        self.alternates = {
+            k[len("ALTERNATES_"):].lower(): v for k, v in os.environ.items() if k.startswith("ALTERNATES_")
+        }
+
+        # Shared HTTP connection pool for model and task endpoints
+        self.http2 = os.getenv("HTTP2", "1").lower() in ("true", "1", "yes")
+        self.http_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.http_max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.http_timeout = float(os.getenv("HTTP_TIMEOUT", "60"))
+        self.http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+        # Encoded-frame cache shared by all tools
+        self.encode_cache_mb = int(os.getenv("ENCODE_CACHE_MB", "64"))
+        # Per-tool encoding overrides, e.g. ENCODE_PROFILE_OCR="tiles=2,quality=95"
+        self.encode_profiles = {
+            k[len("ENCODE_PROFILE_"):].lower(): v for k, v in os.environ.items() if k.startswith("ENCODE_PROFILE_")
+        }
+        self.encode_max_pixels = int(os.getenv("ENCODE_MAX_PIXELS", "0"))
+
+        # Pack multi-frame video requests into timestamped mosaics
+        self.mosaic = os.getenv("MOSAIC", "0").lower() in ("true", "1", "yes")
+        self.mosaic_grid = tuple(int(v) for v in os.getenv("MOSAIC_GRID", "3x3").lower().split("x"))
+        self.mosaic_tile = int(os.getenv("MOSAIC_TILE", "256"))
+
+        # Motion-aware frame admission and sampling
+        self.motion_redundant = float(os.getenv("MOTION_REDUNDANT", "1.0"))
+        self.motion_keyframe = float(os.getenv("MOTION_KEYFRAME", "12"))
+        self.motion_max_gap = float(os.getenv("MOTION_MAX_GAP", "1.0"))
+        self.sample_mode = os.getenv("SAMPLE_MODE", "stride").lower()
+        self.sample_max = int(os.getenv("SAMPLE_MAX", "16"))
+
+        # On-disk archive of frames older than the in-memory buffer (opt-in)
+        self.archive = os.getenv("ARCHIVE", "0").lower() in ("true", "1", "yes")
+        self.archive_dir = os.getenv("ARCHIVE_DIR")
+        self.archive_mb = int(os.getenv("ARCHIVE_MB", "64"))
+        self.archive_max_age = float(os.getenv("ARCHIVE_MAX_AGE", "600"))
+        self.archive_segment_mb = int(os.getenv("ARCHIVE_SEGMENT_MB", "8"))
+        self.archive_side = int(os.getenv("ARCHIVE_SIDE", "320"))
+        self.archive_quality = int(os.getenv("ARCHIVE_QUALITY", "70"))
+        self.archive_interval = float(os.getenv("ARCHIVE_INTERVAL", "1.0"))
+
+        # Background keyframe index for long-range recall (opt-in)
+        self.index = os.getenv("INDEX", "0").lower() in ("true", "1", "yes")
+        self.index_model = os.getenv("INDEX_MODEL")
+        self.index_interval = float(os.getenv("INDEX_INTERVAL", "3"))
+        self.index_rate = float(os.getenv("INDEX_RATE", "0.5"))
+        self.index_burst = float(os.getenv("INDEX_BURST", "4"))
+        self.index_max = int(os.getenv("INDEX_MAX", "512"))
+        self.recall_ranges = int(os.getenv("RECALL_RANGES", "3"))
+
+        # Track localize results between detector calls
+        self.track = os.getenv("TRACK", "1").lower() in ("true", "1", "yes")
+        self.track_min_confidence = float(os.getenv("TRACK_MIN_CONFIDENCE", "0.6"))
+        self.track_max_age = float(os.getenv("TRACK_MAX_AGE", "5"))
+        self.track_max_cut = int(os.getenv("TRACK_MAX_CUT", "16"))
+
+        # Perceptual-hash cache of caption/qa results. ocr is left out by default: a text change on a
+        # page or screen rarely moves the frame hash, so a hit would return stale text as fresh
+        self.result_cache = os.getenv("RESULT_CACHE", "1").lower() in ("true", "1", "yes")
+        self.result_cache_tools = [t.strip() for t in os.getenv("RESULT_CACHE_TOOLS", "caption,qa").split(",") if t.strip()]
+        self.result_cache_distance = int(os.getenv("RESULT_CACHE_DISTANCE", "4"))
+        self.result_cache_ttl = float(os.getenv("RESULT_CACHE_TTL", "30"))
+        self.result_cache_items = int(os.getenv("RESULT_CACHE_ITEMS", "1024"))
+
+        # Compressed snapshot images kept per session
+        self.blob_dir = os.getenv("BLOB_DIR")
+        self.blob_format = os.getenv("BLOB_FORMAT", "webp").lower()
+        self.blob_quality = int(os.getenv("BLOB_QUALITY", "80"))
+        self.blob_thumb = int(os.getenv("BLOB_THUMB", "320"))
+        self.blob_store_mb = int(os.getenv("BLOB_STORE_MB", "32"))
+        self.blob_store_items = int(os.getenv("BLOB_STORE_ITEMS", "64"))
+
+        # Speculative captioning of the live view while idle (opt-in)
+        self.prefetch = os.getenv("PREFETCH", "0").lower() in ("true", "1", "yes")
+        self.prefetch_interval = float(os.getenv("PREFETCH_INTERVAL", "5"))
+        self.prefetch_rate = float(os.getenv("PREFETCH_RATE", "1"))
+        self.prefetch_burst = float(os.getenv("PREFETCH_BURST", "4"))
     
 
 env = Envs()
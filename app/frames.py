@@ -0,0 +1,154 @@
+import itertools
+import time
+from typing import Any, Callable, Iterable, Optional
+import numpy as np
+
+_uids = itertools.count()
+
+
+class FrameBuffer:
+    """Fixed-capacity ring of frames backed by one preallocated array.
+
+    Slots are allocated lazily from the first frame's shape and dtype, so a
+    session that never streams costs nothing. Indexing follows list
+    semantics (``buf[-1]`` is the newest frame) and returns views into the
+    ring: they stay valid until the slot is overwritten, ``capacity`` frames
+    later.
+    """
+
+    def __init__(self, capacity: int, on_evict: Optional[Callable[[np.ndarray, float, bool], Any]] = None) -> None:
+        self.uid: int = next(_uids)
+        self.capacity: int = capacity
+        self.on_evict = on_evict  # called with (frame, timestamp, keyframe) before a slot is overwritten
+        self._data: Optional[np.ndarray] = None
+        self._ts = np.zeros(capacity, dtype=np.float64)
+        self._seq = np.full(capacity, -1, dtype=np.int64)
+        self._key = np.zeros(capacity, dtype=bool)
+        self._hash = np.zeros(capacity, dtype=np.uint64)
+        self._head: int = 0   # next slot to write
+        self._size: int = 0
+        self._count: int = 0  # frames ever written
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._data is None else self._data.nbytes
+
+    def _slot(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("frame index out of range")
+        return (self._head - self._size + index) % self.capacity
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self._data[self._slot(index)]
+
+    def timestamp(self, index: int) -> float:
+        return float(self._ts[self._slot(index)])
+
+    def seq(self, index: int) -> int:
+        return int(self._seq[self._slot(index)])
+
+    def is_keyframe(self, index: int) -> bool:
+        return bool(self._key[self._slot(index)])
+
+    def phash(self, index: int) -> int:
+        return int(self._hash[self._slot(index)])
+
+    def _slot_of(self, frame: np.ndarray) -> Optional[int]:
+        if self._data is None or not isinstance(frame, np.ndarray) or frame.base is not self._data:
+            return None
+        offset = frame.__array_interface__["data"][0] - self._data.__array_interface__["data"][0]
+        slot, rem = divmod(offset, self._data[0].nbytes)
+        if rem or frame.shape != self._data.shape[1:] or not 0 <= slot < self.capacity:
+            return None
+        return slot
+
+    def key(self, frame: np.ndarray) -> Optional[tuple]:
+        """Stable identity ``(buffer uid, seq)`` of a view returned by this buffer, else None."""
+        slot = self._slot_of(frame)
+        return None if slot is None else (self.uid, int(self._seq[slot]))
+
+    def keys(self, frames: Iterable[np.ndarray]) -> list[Optional[tuple]]:
+        return [self.key(f) for f in frames]
+
+    def times(self, frames: Iterable[np.ndarray]) -> list[Optional[float]]:
+        """Capture timestamps of views returned by this buffer."""
+        return [None if (slot := self._slot_of(f)) is None else float(self._ts[slot]) for f in frames]
+
+    def append(self, frame: np.ndarray, ts: Optional[float] = None, keyframe: bool = True, phash: int = 0) -> int:
+        """Copy *frame* into the next slot, evicting the oldest if full. Returns its sequence number."""
+        if self._data is None or self._data.shape[1:] != frame.shape or self._data.dtype != frame.dtype:
+            self._data = np.empty((self.capacity, *frame.shape), dtype=frame.dtype)
+            self._head = self._size = 0
+        slot = self._head
+        if self.on_evict is not None and self._size == self.capacity:
+            self.on_evict(self._data[slot], float(self._ts[slot]), bool(self._key[slot]))
+        np.copyto(self._data[slot], frame)
+        self._ts[slot] = time.time() if ts is None else ts
+        self._seq[slot] = self._count
+        self._key[slot] = keyframe
+        self._hash[slot] = phash
+        self._count += 1
+        self._head = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        return self._count - 1
+
+    def span(self, seconds: float, now: Optional[float] = None) -> int:
+        """Number of newest frames captured within the last *seconds*."""
+        if not self._size:
+            return 0
+        cutoff = (time.time() if now is None else now) - seconds
+        slots = (self._head - self._size + np.arange(self._size)) % self.capacity
+        # timestamps are monotonic in ring order, so this is a sorted search
+        return self._size - int(np.searchsorted(self._ts[slots], cutoff, side="left"))
+
+    def between(self, start: float, end: float) -> list[np.ndarray]:
+        """Views of frames captured in ``[start, end)``, oldest first."""
+        if not self._size:
+            return []
+        slots = (self._head - self._size + np.arange(self._size)) % self.capacity
+        lo, hi = np.searchsorted(self._ts[slots], [start, end], side="left")
+        return [self._data[s] for s in slots[lo:hi]]
+
+    def last(self, count: int, step: int = 1) -> list[np.ndarray]:
+        """Views of the newest *count* frames, oldest first, taking every *step*-th."""
+        count = min(count, self._size)
+        return [self._data[self._slot(i)] for i in range(self._size - count, self._size, max(step, 1))]
+
+    def spaced(self, count: int, interval: float) -> list[np.ndarray]:
+        """Views of frames among the newest *count*, oldest first, captured at least *interval* seconds apart."""
+        count = min(count, self._size)
+        picks, last = [], -np.inf
+        for i in range(self._size - count, self._size):
+            ts = self._ts[self._slot(i)]
+            if ts - last >= interval:
+                picks.append(i)
+                last = ts
+        return [self._data[self._slot(i)] for i in picks]
+
+    def keyframes(self, count: int, limit: int = 0) -> list[np.ndarray]:
+        """Views of the keyframes among the newest *count* frames, plus the newest frame.
+
+        With *limit*, at most that many are returned, spread evenly over the window.
+        """
+        count = min(count, self._size)
+        picks = [i for i in range(self._size - count, self._size - 1) if self._key[self._slot(i)]]
+        picks.append(self._size - 1)
+        if limit and len(picks) > limit:
+            picks = [picks[i] for i in np.linspace(0, len(picks) - 1, limit).round().astype(int)]
+        return [self._data[self._slot(i)] for i in picks]
+
+    def clear(self) -> None:
+        self._head = self._size = 0
+
+    def release(self) -> None:
+        """Drop the backing array; the next append reallocates."""
+        self.clear()
+        self._data = None
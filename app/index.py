@@ -0,0 +1,107 @@
+import asyncio
+import importlib
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, List, Optional
+
+import numpy as np
+
+from .config import logger, env
+
+_STOPWORDS = frozenset(
+    "a an the and or of in on at to for with is are was were be it this that my me i you your "
+    "did do does where when what which who last see seen saw".split()
+)
+
+
+def tokens(text: str) -> set[str]:
+    return {t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in _STOPWORDS}
+
+
+@lru_cache(maxsize=1)
+def load_model(spec: Optional[str] = env.index_model) -> Any:
+    """Load the pluggable local embedding model named by ``INDEX_MODEL`` (``"module:factory"``).
+
+    The factory must return an object with ``embed_image(rgb_frame)`` and
+    ``embed_text(text)``, both returning 1-D vectors. Returns None when no
+    model is configured, in which case the index stores MLLM captions.
+    """
+    if not spec:
+        return None
+    module, _, attr = spec.partition(":")
+    model = getattr(importlib.import_module(module), attr)()
+    logger.info(f"Loaded index model {spec}")
+    return model
+
+
+@dataclass
+class Match:
+    start: float
+    end: float
+    score: float
+    text: str
+
+
+class VisualIndex:
+    """Searchable per-session timeline of keyframe descriptors.
+
+    Each entry covers the time from its keyframe until the next one, and
+    holds a short caption and/or an embedding. At most ``max_entries`` are
+    kept, oldest dropped first.
+    """
+
+    def __init__(self, max_entries: int = env.index_max) -> None:
+        self.max_entries = max_entries
+        self._ts: List[float] = []
+        self._text: List[str] = []
+        self._vectors: List[Optional[np.ndarray]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def add(self, ts: float, text: str = "", vector: Optional[np.ndarray] = None) -> None:
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            # keyframes can be described out of order; keep the timeline sorted
+            i = len(self._ts)
+            while i and self._ts[i - 1] > ts:
+                i -= 1
+            self._ts.insert(i, ts)
+            self._text.insert(i, text)
+            self._vectors.insert(i, vector)
+            if len(self._ts) > self.max_entries:
+                del self._ts[0], self._text[0], self._vectors[0]
+
+    async def search(self, query: str, k: int = 3, now: Optional[float] = None) -> List[Match]:
+        """Best *k* time ranges for *query*, most relevant first (ties go to the most recent)."""
+        model = load_model()
+        qvec = None
+        if model is not None:
+            # a local model would otherwise block every session's turns on the shared loop
+            qvec = np.asarray(await asyncio.to_thread(model.embed_text, query), dtype=np.float32)
+            qvec = qvec / (np.linalg.norm(qvec) or 1.0)
+        qtok = tokens(query)
+        with self._lock:
+            ts, text, vectors = list(self._ts), list(self._text), list(self._vectors)
+        scores = []
+        for i, (t, vec) in enumerate(zip(text, vectors)):
+            if qvec is not None and vec is not None:
+                score = float(vec @ qvec)
+            else:
+                score = len(qtok & tokens(t)) / len(qtok) if qtok else 0.0
+            if score > 0:
+                scores.append((score, ts[i], i))
+        scores.sort(reverse=True)
+        ends = ts[1:] + [now if now is not None else (ts[-1] + 1.0 if ts else 0.0)]
+        return [Match(ts[i], ends[i], score, text[i]) for score, _, i in scores[:k]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ts.clear()
+            self._text.clear()
+            self._vectors.clear()
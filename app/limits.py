@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from .config import env
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, holding at most ``burst``.
+
+    A ``rate`` of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def take(self, n: float = 1.0) -> bool:
+        """Consume *n* tokens if available, without waiting."""
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < n:
+                return False
+            self._tokens -= n
+            return True
+
+    def delay(self, n: float = 1.0) -> float:
+        """Seconds until *n* tokens are available, 0 if they are now."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (n - self._tokens) / self.rate)
+
+
+# Priority classes, most urgent first
+INTERACTIVE, BULK, BACKGROUND = 0, 1, 2
+
+
+class Busy(Exception):
+    """A request was shed because its endpoint is saturated."""
+
+
+class Limiter:
+    """Admission control for one model endpoint, shared by every session.
+
+    At most ``concurrency`` requests are in flight, and they start at no
+    more than ``rate`` per second (bursts of ``burst``). Requests that
+    cannot start wait in a priority queue, interactive before bulk, FIFO
+    within a class. Instead of queuing, a request fails fast with Busy when
+    ``max_queue`` requests are already waiting or when it is background
+    work, which never queues; a queued request that is still waiting after
+    ``max_wait`` seconds gets Busy as well. 0 disables the respective limit.
+
+    Must be used from the shared agent runtime's event loop.
+    """
+
+    def __init__(self, name: str, concurrency: int = 0, rate: float = 0.0, burst: float = 1.0,
+                 max_queue: int = 0, max_wait: float = 0.0) -> None:
+        self.name = name
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.active: int = 0
+        self.admitted: int = 0
+        self.shed: int = 0
+
+    @classmethod
+    def parse(cls, name: str, spec: str, **defaults: float) -> "Limiter":
+        """Build from ``"concurrency=16,rate=20,burst=4,queue=64,wait=10"`` style overrides of *defaults*."""
+        fields = dict(defaults)
+        fields.update({k.strip(): float(v) for k, v in (kv.split("=", 1) for kv in spec.split(",") if kv.strip())})
+        return cls(name, concurrency=int(fields.get("concurrency", 0)), rate=fields.get("rate", 0.0),
+                   burst=fields.get("burst", 1.0), max_queue=int(fields.get("queue", 0)), max_wait=fields.get("wait", 0.0))
+
+    @property
+    def queued(self) -> int:
+        return sum(not f.done() for _, _, f in self._waiters)
+
+    def _free(self) -> bool:
+        return not self.concurrency or self.active < self.concurrency
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        """Hold one of the endpoint's request slots; raises Busy if the request is shed."""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int) -> None:
+        if not self.queued and self._free() and self.bucket.take():
+            self.active += 1
+            self.admitted += 1
+            return
+        if priority >= BACKGROUND or (self.max_queue and self.queued >= self.max_queue):
+            self.shed += 1
+            raise Busy(f"{self.name} is busy ({self.active} running, {self.queued} waiting)")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        self._wake()
+        try:
+            await asyncio.wait_for(future, self.max_wait or None)
+        except BaseException as exc:
+            if future.done() and not future.cancelled():
+                self._release()  # admitted just as the wait ended
+            else:
+                future.cancel()
+            if isinstance(exc, asyncio.TimeoutError):
+                self.shed += 1
+                raise Busy(f"{self.name} is busy (waited {self.max_wait:g}s)") from None
+            raise
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._free():
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self.bucket.delay()
+            if delay > 0 or not self.bucket.take():
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self._tick)
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            self.active += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    def _tick(self) -> None:
+        self._timer = None
+        self._wake()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "queued": self.queued, "admitted": self.admitted, "shed": self.shed}
+
+
+# Shared by every session: the MLLM endpoint (END_LANG) and the detector (END_TASK / END_TASK_BATCH)
+lang_limiter = Limiter.parse("END_LANG", env.limit_lang, concurrency=32, queue=64, wait=10)
+task_limiter = Limiter.parse("END_TASK", env.limit_task, concurrency=16, queue=64, wait=10)
@@ -1,8 +1,11 @@
 import asyncio
+import contextvars
 from dataclasses import dataclass, field
 from agents import Runner, RunHooks
+from typing import Any, Deque, Dict, Optional, List
+from collections import Counter, deque
+import itertools
 import threading
-from typing import Any, Dict, Optional, List
 import traceback
 import time
 from datetime import datetime
@@ -10,18 +13,28 @@ import numpy as np
 import gradio as gr
 
 from .config import logger, env
-@dataclass
+from .frames import FrameBuffer
+from .motion import ChangeDetector
+from .cache import result_cache
+from .blobs import Blob, BlobStore
+from .track import BoxTracker
+from .archive import FrameArchive
+from .index import VisualIndex
+from .runtime import runtime
+from .metrics import metrics
+from .streaming import ThinkFilter
+@dataclass(slots=True)
 class RunnerStep:
-    """Log entry for a single Runner step"""
-    timestamp: str
+    """Log entry for a single Runner step; the timestamp is only formatted when the step is printed"""
     step_type: str
     agent_name: str
     turn_number: int
     details: Dict[str, Any] = field(default_factory=dict)
     duration_ms: Optional[float] = None
+    timestamp: float = field(default_factory=time.time)
 
     def __str__(self) -> str:
-        return f"[{self.timestamp}][T{self.turn_number}][{self.step_type}]: {self.details}"
+        return f"[{datetime.fromtimestamp(self.timestamp).isoformat()}][T{self.turn_number}][{self.step_type}]: {self.details}"
 
 @dataclass
 class Message:
@@ -42,6 +55,11 @@ class Message:
     def tool(cls, content: str, **kwargs) -> "Message":
         return cls("assistant", content, 'tool', kwargs)
     
+    @classmethod
+    def from_snapshot(cls, snapshot: "Snapshot") -> "Message":
+        refs = {"blob": snapshot.data.id} if isinstance(snapshot.data, Blob) else {}
+        return cls.tool(snapshot.gr, title=snapshot.sender, status=snapshot.status, **refs)
+
     @classmethod
     def assistant(cls, content: str, mode='') -> "Message":
         return cls("assistant", content, mode)
@@ -53,7 +71,7 @@ class Message:
     def to_dict(self) -> Dict[str, Any]:
         result = {"role": self.role, "content": self.content}
         if self.mode == "tool":
-            metadata = self.metadata.copy()
+            metadata = {k: v for k, v in self.metadata.items() if k != "blob"}
             if title := metadata.get("title"):
                 metadata["title"] = title.title()
             result["metadata"] = metadata
@@ -68,6 +86,8 @@ class Snapshot:
     
     @property
     def gr(self):
+        if isinstance(self.data, Blob):
+            return gr.Image(self.data.thumb)
         if isinstance(self.data, np.ndarray):
             return gr.Image(self.data)
         return self.data
@@ -81,6 +101,8 @@ class RunnerLoggerHooks(RunHooks):
         self.memory = memory_instance
         self.current_turn = 0
         self.turn_start_time = None
+        self.llm_start_time = None
+        self.tool_start_times: Dict[str, float] = {}  # by tool call id, as calls of one tool can overlap
     
     async def on_agent_start(self, context, agent):
         self.current_turn += 1
@@ -91,7 +113,6 @@ class RunnerLoggerHooks(RunHooks):
             status='pending'
         ))
         step = RunnerStep(
-            timestamp=datetime.now().isoformat(),
             step_type="turn_start",
             agent_name=agent.name,
             turn_number=self.current_turn,
@@ -99,6 +120,23 @@ class RunnerLoggerHooks(RunHooks):
         )
         self.memory.log_runner_step(step)
     
+    async def on_llm_start(self, context, agent, system_prompt, input_items):
+        self.llm_start_time = time.time()
+
+    async def on_llm_end(self, context, agent, response):
+        if self.llm_start_time is None:
+            return
+        duration = time.time() - self.llm_start_time
+        self.llm_start_time = None
+        metrics.observe("copilot_agent_llm_seconds", duration, session=self.memory.uid)
+        self.memory.log_runner_step(RunnerStep(
+            step_type="llm_call",
+            agent_name=agent.name,
+            turn_number=self.current_turn,
+            details={"message": f"Agent {agent.name} model call completed"},
+            duration_ms=duration * 1000
+        ))
+
     async def on_agent_end(self, context, agent, result):
         if self.turn_start_time:
             duration = (time.time() - self.turn_start_time) * 1000
@@ -106,7 +144,6 @@ class RunnerLoggerHooks(RunHooks):
             duration = None
             
         step = RunnerStep(
-            timestamp=datetime.now().isoformat(),
             step_type="agent_call",
             agent_name=agent.name,
             turn_number=self.current_turn,
@@ -122,13 +159,13 @@ class RunnerLoggerHooks(RunHooks):
             if hasattr(tool_call, attr):
                 tool_args = getattr(tool_call, attr)
                 break
+        self.tool_start_times[getattr(context, 'tool_call_id', tool_name)] = time.time()
         self.memory.snapshots.append(Snapshot(
             sender='agent',
             status='pending',
             data=f'Calling **{tool_name}**'
         ))
         step = RunnerStep(
-            timestamp=datetime.now().isoformat(),
             step_type="tool_call",
             agent_name=agent.name,
             turn_number=self.current_turn,
@@ -143,9 +180,10 @@ class RunnerLoggerHooks(RunHooks):
     async def on_tool_end(self, context, agent, tool_call, result):
         # Handle different tool_call object attributes safely
         tool_name = getattr(tool_call, 'name', 'unknown')
+        start = self.tool_start_times.pop(getattr(context, 'tool_call_id', tool_name), None)
+        duration = (time.time() - start) * 1000 if start is not None else None
         
         step = RunnerStep(
-            timestamp=datetime.now().isoformat(),
             step_type="tool_result",
             agent_name=agent.name,
             turn_number=self.current_turn,
@@ -153,136 +191,376 @@ class RunnerLoggerHooks(RunHooks):
                 "tool_name": tool_name,
                 "result_length": len(str(result)) if result else 0,
                 "message": f"Tool {tool_name} completed"
-            }
+            },
+            duration_ms=duration
         )
         self.memory.log_runner_step(step)
 
 
 class Chat:
+    """Chat history with a version counter and a cached serialized form.
+
+    Every mutation bumps ``version``; ``messages`` is rebuilt at most once
+    per version, and ``diff`` returns only what changed since a version a
+    consumer has already seen.
+    """
+
     def __init__(self):
-        self.history = [] 
+        self.history: List[Message] = []
+        self.version: int = 0
+        self._dicts: List[Dict[str, Any]] = []
+        self._touched: List[int] = []  # version that last changed each message
+        self.status: Optional[int] = None  # index of the open pending tool status
+        self._messages: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def append(self, message: Message) -> int:
+        """Add *message* and return its index."""
+        with self._lock:
+            return self._append(message)
+
+    def replace(self, index: int, message: Message):
+        with self._lock:
+            self._replace(index, message)
+
+    def append_tool(self, message: Message) -> int:
+        """Add a tool message in place of the open pending status, or at the end if there is none.
 
-    def append(self, message: Message):
+        The status is tracked by index rather than looked for at the end, as
+        user messages sent during a run are appended after it.
+        """
+        with self._lock:
+            if self.status is not None:
+                index = self.status
+                self._replace(index, message)
+            else:
+                index = self._append(message)
+            self.status = index if message.metadata.get('status') == 'pending' else None
+            return index
+
+    def resolve_status(self, content: str) -> None:
+        """Close the open pending status, if any, with *content*."""
+        with self._lock:
+            if self.status is not None:
+                title = self.history[self.status].metadata.get('title')
+                self._replace(self.status, Message.tool(content, title=title, status='done'))
+                self.status = None
+
+    def _append(self, message: Message) -> int:
+        self.version += 1
         self.history.append(message)
-    
+        self._dicts.append(message.to_dict())
+        self._touched.append(self.version)
+        self._messages = None
+        return len(self.history) - 1
+
+    def _replace(self, index: int, message: Message):
+        self.version += 1
+        self.history[index] = message
+        self._dicts[index] = message.to_dict()
+        self._touched[index] = self.version
+        self._messages = None
+
     @property
     def messages(self):
-        return [i.to_dict() for i in self.history]
+        with self._lock:
+            if self._messages is None:
+                self._messages = list(self._dicts)
+            return self._messages
+
+    def diff(self, since: int) -> tuple[int, List[Dict[str, Any]]]:
+        """``(start, messages[start:])`` covering every message changed after version *since*."""
+        with self._lock:
+            start = next((i for i, v in enumerate(self._touched) if v > since), len(self._dicts))
+            return start, self._dicts[start:]
+
+
+_session_ids = itertools.count()
+
+# Snapshot slot of the tool call running in the current task, see Memory.open_slot
+current_slot: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("current_slot", default=None)
 
 
 class Memory:
     def __init__(self, agent, limit: int = 200) -> None:
+        self.uid: int = next(_session_ids)
         self.limit: int = limit
-        self.frames: list[Any] = []  
-        self.snapshots: list[Any] = []      
+        self.archive: Optional[FrameArchive] = FrameArchive() if env.archive else None
+        self.frames: FrameBuffer = FrameBuffer(limit, on_evict=self.archive.add if self.archive is not None else None)
+        self.motion = ChangeDetector()
+        self.tracker = BoxTracker()
+        self.index = VisualIndex()
+        self.indexed_seq: int = -1
+        self.last_indexed: float = 0
+        self.cache_stats: Counter = Counter()
+        self.prefetching: bool = False
+        self.prefetch_task: Optional[asyncio.Task] = None
+        self.last_prefetch: float = 0
+        self.prefetched_seq: int = -1
+        self.emitted_version: int = -1  # chat version last pushed to the client
+        # Tool results waiting for the frame handler to show them; bounded in case frames stop arriving
+        self.snapshots: Deque[Snapshot] = deque(maxlen=256)
+        # Tool calls of one turn run concurrently; their snapshots are released in call order
+        self._slots: Dict[int, List[Snapshot]] = {}
+        self._slot_done: set[int] = set()
+        self._slot_ids = itertools.count()
+        self.tool_slots = asyncio.Semaphore(env.tool_concurrency)
         self.inputs: list[Any] = [] 
         self.chat = Chat()
+        self.blobs = BlobStore(on_expire=self._expire_blob)
 
-        self.runner_steps: List[RunnerStep] = []
         self.step_limit: int = 1000  # Keep last 1000 steps
+        self.runner_steps: Deque[RunnerStep] = deque(maxlen=self.step_limit)
         self.logger_hooks: Optional[RunnerLoggerHooks] = None
 
-        self._chat_q: asyncio.Queue[Any] = asyncio.Queue()
-        self._input_q: asyncio.Queue[Any] = asyncio.Queue()
-        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Pending inputs, drained by the shared runtime's worker pool
+        self.pending: Deque[str] = deque()
+        self.scheduled: bool = False
+        self.run_task: Optional[asyncio.Task] = None  # set by the runtime while a run is in progress
+        self.recorder: Optional[Any] = None  # app.replay.Recorder when RECORD_DIR is set
+        self.closed: bool = False
         self.is_waiting: bool = False
         self.is_running: bool = False
         self._last_frame_time: float = 0
+        self.last_active: float = time.time()
         self.setup(agent)
 
     def log_runner_step(self, step: RunnerStep) -> None:
         """Log a runner step and maintain the step history limit"""
         self.runner_steps.append(step)
-        logger.debug(f"[ 🛠️ ]{step}")
-        while len(self.runner_steps) > self.step_limit:
-            self.runner_steps.pop(0)
+        logger.debug("[ 🛠️ ]%s", step)
 
-    def enqueue(self, data: Any) -> None:
+    def enqueue(self, data: Any) -> List[Snapshot]:
+        """Store *data* if it is due and worth keeping; returns the snapshots waiting to be shown."""
         current_time = time.time()
         if  current_time-self._last_frame_time > 1.0 / env.fps:
             self._last_frame_time = current_time
-            self.frames.append(data)
-            while len(self.frames) > self.limit:
-                self.frames.pop(0)
-        return self.snapshots.pop(0) if self.snapshots else None
+            change = self.motion.check(data, current_time)
+            if change.admit:
+                self.frames.append(data, current_time, keyframe=change.keyframe, phash=change.phash)
+        return self.drain_snapshots()
+
+    def drain_snapshots(self) -> List[Snapshot]:
+        """Take every pending snapshot, oldest first."""
+        drained = []
+        # popped from both the frame handler and the agent runtime; popleft is atomic
+        while True:
+            try:
+                drained.append(self.snapshots.popleft())
+            except IndexError:
+                return drained
+
+    def show(self, snapshot: Snapshot) -> None:
+        self.chat.append_tool(Message.from_snapshot(snapshot))
+
+    def settle(self, note: str) -> None:
+        """Show queued tool results and close the run's open status after a run that did not finish."""
+        for snapshot in self.drain_snapshots():
+            if snapshot.status != 'pending':
+                self.show(snapshot)
+        self.chat.resolve_status(note)
     
+    def open_slot(self) -> int:
+        """Reserve a place in the snapshot order for a tool call that is starting."""
+        slot = next(self._slot_ids)
+        self._slots[slot] = []
+        return slot
+
+    def post(self, snapshot: Snapshot) -> None:
+        """Record a tool snapshot; inside a tool slot it is held until earlier slots finish."""
+        slot = current_slot.get()
+        if slot is None or slot not in self._slots:
+            self.snapshots.append(snapshot)
+        else:
+            self._slots[slot].append(snapshot)
+
+    def close_slot(self, slot: int) -> None:
+        self._slot_done.add(slot)
+        while self._slots and (first := next(iter(self._slots))) in self._slot_done:
+            self.snapshots.extend(self._slots.pop(first))
+            self._slot_done.discard(first)
+
+    def _expire_blob(self, blob_id: str) -> None:
+        """Replace chat snapshots whose image was evicted from the blob store."""
+        for i, message in enumerate(self.chat.history):
+            if message.metadata.get("blob") == blob_id:
+                self.chat.replace(i, Message.tool("_Snapshot expired_", title=message.metadata.get("title"), status="done"))
+
     def receive(self, text: str) -> None:
+        """Take a user message, applying ``RUN_POLICY`` if the agent is still busy."""
         self.chat.append(Message.user(text))
-        self._loop.call_soon_threadsafe(self._chat_q.put_nowait, text)
-
+        busy = self.is_running or bool(self.pending)
+        if busy and env.run_policy == "reject":
+            self.chat.append(Message.assistant("_Still working on your previous message; please send this again once I have answered._"))
+            return
+        runtime.submit(self, text, replace=busy and env.run_policy == "replace")
 
     def setup(self, agent) -> None:
-        """Bind *agent* and spawn the background monitor threads."""
+        """Bind the (shared) *agent*; turns run on the process-wide runtime."""
         self.v_agent = agent
         self.logger_hooks = RunnerLoggerHooks(self)
-        def _runner() -> None:
-            self._loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self._loop)
-            try:
-                self._loop.create_task(self._monitor_chat())
-                self._loop.run_forever()
-            finally:
-                self._loop.close()
 
-        threading.Thread(target=_runner, daemon=True).start()
+    def close(self) -> None:
+        """Drop pending inputs and release the frame buffer."""
+        self.closed = True
+        self.pending.clear()
+        runtime.cancel(self)
+        metrics.drop(session=self.uid)
+        if self.recorder is not None:
+            self.recorder.close()
+        self.frames.release()
+        self.motion.reset()
+        self.tracker.clear()
+        self.index.clear()
+        result_cache.drop(self.uid)
+        self.blobs.close()
+        if self.archive is not None:
+            self.archive.close()
+        self.snapshots.clear()
     
-    async def _monitor_chat(self) -> None:
-        """Process incoming chat messages, respecting the waiting gate."""
-        while True:
-            text = await self._chat_q.get()
-            logger.debug(f"Processing: {text}")
-            start_step = RunnerStep(
-                timestamp=datetime.now().isoformat(),
-                step_type="processing_start",
+    async def run(self, text: str) -> None:
+        """Run the agent on one user input and append its answer to the chat."""
+        started, outcome = time.perf_counter(), "cancelled"
+        try:
+            outcome = await self._turn(text)
+        finally:
+            metrics.observe("copilot_turn_seconds", time.perf_counter() - started, session=self.uid, outcome=outcome)
+
+    async def _turn(self, text: str) -> str:
+        logger.debug("Processing: %s", text)
+        start_step = RunnerStep(
+            step_type="processing_start",
+            agent_name=getattr(self.v_agent, 'name', 'unknown'),
+            turn_number=0,
+            details={"user_input": text}
+        )
+        self.log_runner_step(start_step)
+        
+        try:
+            self.is_running = True
+            result, reply = await asyncio.wait_for(self._run_agent(text), env.run_timeout or None)
+            
+            self.is_running = False
+            
+            # Log successful completion
+            success_step = RunnerStep(
+                step_type="final_output",
                 agent_name=getattr(self.v_agent, 'name', 'unknown'),
-                turn_number=0,
-                details={"user_input": text}
+                turn_number=self.logger_hooks.current_turn if self.logger_hooks else 0,
+                details={
+                    "output_type": type(result.final_output).__name__,
+                    "output_preview": str(result.final_output)[:100] + "..." if len(str(result.final_output)) > 100 else str(result.final_output)
+                }
             )
-            self.log_runner_step(start_step)
+            self.log_runner_step(success_step)
             
-            try:
-                self.is_running = True
-                result = await Runner.run(
-                    starting_agent=self.v_agent,
-                    input=text,
-                    context=self,
-                    hooks=self.logger_hooks  # Add our custom hooks here
-                )
-                
-                self.is_running = False
-                
-                # Log successful completion
-                success_step = RunnerStep(
-                    timestamp=datetime.now().isoformat(),
-                    step_type="final_output",
-                    agent_name=getattr(self.v_agent, 'name', 'unknown'),
-                    turn_number=self.logger_hooks.current_turn if self.logger_hooks else 0,
-                    details={
-                        "output_type": type(result.final_output).__name__,
-                        "output_preview": str(result.final_output)[:100] + "..." if len(str(result.final_output)) > 100 else str(result.final_output)
-                    }
-                )
-                self.log_runner_step(success_step)
-                
-            except Exception as exc:  # noqa: BLE001
-                self.is_running = False
-                full_traceback = traceback.format_exc()
-                logger.debug(f"Error in _monitor_chat: {exc}\n{full_traceback}")
-                
-                # Log the error
-                error_step = RunnerStep(
-                    timestamp=datetime.now().isoformat(),
-                    step_type="error",
-                    agent_name=getattr(self.v_agent, 'name', 'unknown'),
-                    turn_number=self.logger_hooks.current_turn if self.logger_hooks else 0,
-                    details={
-                        "error_type": type(exc).__name__,
-                        "error_message": str(exc),
-                        "traceback": full_traceback
-                    }
-                )
-                self.log_runner_step(error_step)
-                continue
-            final = result.final_output.split('</think>', 1)[-1]
+        except asyncio.CancelledError:
+            # replaced by a newer message, or the session closed
+            self.is_running = False
+            self.settle("_Stopped_")
+            self.log_runner_step(RunnerStep(
+                step_type="cancelled",
+                agent_name=getattr(self.v_agent, 'name', 'unknown'),
+                turn_number=self.logger_hooks.current_turn if self.logger_hooks else 0,
+            ))
+            raise
+        except asyncio.TimeoutError:
+            self.is_running = False
+            self.settle("_Timed out_")
+            self.log_runner_step(RunnerStep(
+                step_type="timeout",
+                agent_name=getattr(self.v_agent, 'name', 'unknown'),
+                turn_number=self.logger_hooks.current_turn if self.logger_hooks else 0,
+                details={"run_timeout": env.run_timeout}
+            ))
+            self.chat.append(Message.assistant("_Sorry, this is taking too long. Please ask again._"))
+            return "timeout"
+        except Exception as exc:  # noqa: BLE001
+            self.is_running = False
+            self.settle("_Failed_")
+            full_traceback = traceback.format_exc()
+            logger.debug("Error in Memory.run: %s\n%s", exc, full_traceback)
+            
+            # Log the error
+            error_step = RunnerStep(
+                step_type="error",
+                agent_name=getattr(self.v_agent, 'name', 'unknown'),
+                turn_number=self.logger_hooks.current_turn if self.logger_hooks else 0,
+                details={
+                    "error_type": type(exc).__name__,
+                    "error_message": str(exc),
+                    "traceback": full_traceback
+                }
+            )
+            self.log_runner_step(error_step)
+            return "error"
+        final = result.final_output.split('</think>', 1)[-1]
+        if reply is None:
             self.chat.append(Message.assistant(final))
-            await asyncio.sleep(0)
+        else:
+            self.chat.replace(reply, Message.assistant(final))
+        await asyncio.sleep(0)
+        return "ok"
+
+    async def _run_agent(self, text: str) -> tuple[Any, Optional[int]]:
+        """``(result, chat index of the streamed answer or None)`` for one agent run."""
+        if not env.stream:
+            result = await Runner.run(
+                starting_agent=self.v_agent,
+                input=text,
+                context=self,
+                hooks=self.logger_hooks  # Add our custom hooks here
+            )
+            return result, None
+        result = Runner.run_streamed(
+            starting_agent=self.v_agent,
+            input=text,
+            context=self,
+            hooks=self.logger_hooks
+        )
+        # stream_events() swallows a cancel and then waits for the run to finish, so the stream is
+        # consumed in its own task and the run is stopped from here, with its model and tool calls
+        consumer = asyncio.ensure_future(self._stream_reply(result))
+        try:
+            return result, await asyncio.shield(consumer)
+        except asyncio.CancelledError:
+            result.cancel()
+            consumer.cancel()
+            raise
+
+    async def _stream_reply(self, result) -> Optional[int]:
+        """Show the answer in the chat while a streamed run generates it.
+
+        Every model call of the run streams into a fresh message, with think
+        blocks hidden; tool progress keeps arriving through the hooks and
+        tool snapshots. Returns the chat index of the last call's message,
+        or None if it produced no visible text.
+        """
+        reply: Optional[int] = None
+        think, shown, updated = ThinkFilter(env.think_open), "", 0.0
+        async for event in result.stream_events():
+            if event.type != "raw_response_event":
+                continue
+            kind = event.data.type
+            if kind == "response.created":
+                reply, think, shown = None, ThinkFilter(env.think_open), ""
+                continue
+            if kind == "response.output_text.delta":
+                text = think.feed(event.data.delta)
+            elif kind == "response.completed":
+                text = think.flush()
+            else:
+                continue
+            now = time.monotonic()
+            if text == shown or (reply is None and not text):
+                continue
+            if kind == "response.completed" or now - updated >= env.stream_interval:
+                if reply is None:
+                    # tool results queued for the chat go above the answer
+                    for snapshot in self.drain_snapshots():
+                        self.show(snapshot)
+                    reply = self.chat.append(Message.assistant(text))
+                else:
+                    self.chat.replace(reply, Message.assistant(text))
+                shown, updated = text, now
+        return reply
@@ -0,0 +1,175 @@
+import bisect
+import contextlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .config import logger, env
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES = tuple(2 ** p for p in range(10, 25, 2))  # 1 KiB .. 16 MiB
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the *q* quantile (the largest finite bound past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Process-wide histograms, one per metric name and label set.
+
+    ``observe`` and ``timer`` record values; ``render`` produces the
+    Prometheus text exposition format and ``summary`` a nested dict of
+    count, mean and bucketed p50/p95 for in-process use. Series labelled
+    with a session are dropped when the session closes. Components
+    ``register`` a ``stats()`` callable, whose live counts are read at
+    export time: numeric ones become gauges, and all of them appear in
+    ``stats``.
+    """
+
+    def __init__(self) -> None:
+        self._series: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._help: Dict[str, str] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help: str, buckets: Sequence[float] = SECONDS) -> None:
+        self._help[name] = help
+        self._buckets[name] = buckets
+
+    def register(self, component: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        self._stats[component] = stats
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """``{component: stats()}`` of every registered component."""
+        return {component: stats() for component, stats in list(self._stats.items())}
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self._buckets.get(name, SECONDS))
+            hist.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def drop(self, **labels) -> None:
+        """Forget every series carrying all of *labels*, e.g. ``drop(session=3)``."""
+        match = {(k, str(v)) for k, v in labels.items()}
+        with self._lock:
+            for series in self._series.values():
+                for key in [key for key in series if match <= set(key)]:
+                    del series[key]
+
+    def summary(self, name: Optional[str] = None) -> dict:
+        """``{name: {"tool=qa,session=3": {count, mean, p50, p95}}}``, for one metric or all."""
+        with self._lock:
+            names = [name] if name else sorted(self._series)
+            return {
+                n: {
+                    ",".join(f"{k}={v}" for k, v in key): {
+                        "count": h.count,
+                        "mean": h.sum / h.count if h.count else 0.0,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                    }
+                    for key, h in self._series.get(n, {}).items()
+                }
+                for n in names
+            }
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._series):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in self._series[name].items():
+                    labels = ",".join(f'{k}="{v}"' for k, v in key)
+                    sep = "," if labels else ""
+                    cumulative = 0
+                    for bound, n in zip((*h.buckets, "+Inf"), h.counts):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {h.count}")
+        for component, stats in self.stats().items():
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE copilot_{component}_{key} gauge")
+                    lines.append(f"copilot_{component}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("copilot_encode_seconds", "Frame encoding time per MLLM request")
+metrics.describe("copilot_payload_bytes", "Image bytes sent per model request", BYTES)
+metrics.describe("copilot_request_seconds", "Network time of one MLLM or detector request attempt")
+metrics.describe("copilot_tool_seconds", "Tool call duration, including waiting for admission")
+metrics.describe("copilot_agent_llm_seconds", "Agent model calls that decide on tools or write the answer")
+metrics.describe("copilot_turn_seconds", "End-to-end time from a user message to the answer")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.startswith("/metrics"):
+            body, kind = metrics.render().encode(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/summary"):
+            body, kind = json.dumps({**metrics.summary(), "stats": metrics.stats()}).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", kind)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve(port: int = env.metrics_port, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Expose ``/metrics`` (Prometheus text) and ``/summary`` (JSON) on a daemon thread; no-op for port 0."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,75 @@
+from typing import NamedTuple, Optional
+import cv2
+import numpy as np
+
+from .config import env
+
+
+def thumbnail(frame: np.ndarray, size: int = 32) -> np.ndarray:
+    """Tiny grayscale version of an RGB frame for cheap comparisons."""
+    small = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY) if small.ndim == 3 else small
+
+
+def dhash(thumb: np.ndarray) -> int:
+    """64-bit difference hash of a grayscale thumbnail."""
+    small = cv2.resize(thumb, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def mad(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two thumbnails, 0-255."""
+    return float(cv2.absdiff(a, b).mean())
+
+
+class Change(NamedTuple):
+    admit: bool      # worth storing
+    keyframe: bool   # differs noticeably from the previous keyframe
+    score: float     # MAD against the last admitted frame
+    phash: int
+
+
+class ChangeDetector:
+    """Classifies incoming frames as redundant, ordinary or keyframes.
+
+    A frame is redundant when it barely differs from the last admitted
+    frame; redundant frames are still admitted every ``max_gap`` seconds
+    so the newest stored frame never goes stale. A keyframe differs from
+    the previous keyframe by at least ``keyframe`` (MAD on 0-255).
+    """
+
+    def __init__(
+        self,
+        redundant: float = env.motion_redundant,
+        keyframe: float = env.motion_keyframe,
+        max_gap: float = env.motion_max_gap,
+    ) -> None:
+        self.redundant = redundant
+        self.keyframe = keyframe
+        self.max_gap = max_gap
+        self._last: Optional[np.ndarray] = None
+        self._last_ts: float = 0
+        self._key: Optional[np.ndarray] = None
+
+    def check(self, frame: np.ndarray, ts: float) -> Change:
+        thumb = thumbnail(frame)
+        phash = dhash(thumb)
+        if self._last is None:
+            self._last, self._last_ts, self._key = thumb, ts, thumb
+            return Change(True, True, 255.0, phash)
+        score = mad(thumb, self._last)
+        if score < self.redundant and ts - self._last_ts < self.max_gap:
+            return Change(False, False, score, phash)
+        self._last, self._last_ts = thumb, ts
+        is_key = mad(thumb, self._key) >= self.keyframe
+        if is_key:
+            self._key = thumb
+        return Change(True, is_key, score, phash)
+
+    def reset(self) -> None:
+        self._last = self._key = None
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from .config import logger, env
+from .index import load_model
+from .limits import BACKGROUND, TokenBucket
+from .memory import Memory
+from .runtime import runtime
+from .tool import CAPTION_PROMPT, ask_frame, completion_image
+
+INDEX_PROMPT = "In one short sentence, list the main objects, people, text and activity visible in the image."
+
+
+class Prefetcher:
+    """Captions the live view in the background while a session is idle.
+
+    Triggered by keyframes (a noticeable scene change). Each session is
+    prefetched at most once per ``interval`` seconds and all sessions share
+    a token bucket of ``rate`` captions per second. The caption lands in the
+    result cache, so a later ``caption`` call on a matching frame returns
+    it without a model round trip.
+    """
+
+    def __init__(self, interval: float = env.prefetch_interval, rate: float = env.prefetch_rate,
+                 burst: float = env.prefetch_burst) -> None:
+        self.interval = interval
+        self.bucket = TokenBucket(rate, burst)
+        self.started: int = 0
+        self.failed: int = 0
+
+    def observe(self, mem: Memory) -> None:
+        """Called after each enqueued frame; schedules a caption when worthwhile."""
+        cached = env.result_cache and "caption" in env.result_cache_tools
+        if not (env.prefetch and cached) or not mem.frames or not mem.frames.is_keyframe(-1):
+            return
+        seq = mem.frames.seq(-1)
+        if seq == mem.prefetched_seq or mem.is_running or mem.pending or mem.prefetching:
+            return
+        now = time.time()
+        if now - mem.last_prefetch < self.interval or not self.bucket.take():
+            return
+        mem.prefetching, mem.last_prefetch, mem.prefetched_seq = True, now, seq
+        self.started += 1
+        runtime.spawn(self._caption(mem))
+
+    async def _caption(self, mem: Memory) -> None:
+        mem.prefetch_task = asyncio.current_task()
+        try:
+            await ask_frame(mem, "caption", CAPTION_PROMPT, profile="caption", background=True)
+        except Exception as exc:  # noqa: BLE001
+            self.failed += 1
+            logger.debug(f"Prefetch caption failed: {exc}")
+        finally:
+            mem.prefetching = False
+
+    def stats(self) -> dict:
+        return {"started": self.started, "failed": self.failed}
+
+
+class Indexer:
+    """Describes keyframes in the background into each session's ``VisualIndex``.
+
+    Uses the local ``INDEX_MODEL`` embedding model when configured, otherwise
+    a short MLLM caption. Budgeted like the prefetcher: one keyframe per
+    session every ``interval`` seconds, ``rate`` descriptions per second
+    across all sessions.
+    """
+
+    def __init__(self, interval: float = env.index_interval, rate: float = env.index_rate,
+                 burst: float = env.index_burst) -> None:
+        self.interval = interval
+        self.bucket = TokenBucket(rate, burst)
+        self.indexed: int = 0
+        self.failed: int = 0
+
+    def observe(self, mem: Memory) -> None:
+        if not env.index or not mem.frames or not mem.frames.is_keyframe(-1):
+            return
+        seq = mem.frames.seq(-1)
+        now = time.time()
+        if seq == mem.indexed_seq or now - mem.last_indexed < self.interval or not self.bucket.take():
+            return
+        mem.indexed_seq, mem.last_indexed = seq, now
+        # copy: the ring-buffer slot may be overwritten before the description is done
+        runtime.spawn(self._describe(mem, mem.frames[-1].copy(), mem.frames.timestamp(-1)))
+
+    async def _describe(self, mem: Memory, frame, ts: float) -> None:
+        try:
+            model = load_model()
+            if model is not None:
+                mem.index.add(ts, vector=await asyncio.to_thread(model.embed_image, frame))
+            else:
+                text = await completion_image([frame], INDEX_PROMPT, env.model_mllm, profile="video", priority=BACKGROUND,
+                                              tool="index")
+                mem.index.add(ts, text=text)
+            self.indexed += 1
+        except Exception as exc:  # noqa: BLE001
+            self.failed += 1
+            logger.debug(f"Indexing keyframe failed: {exc}")
+
+    def stats(self) -> dict:
+        return {"indexed": self.indexed, "failed": self.failed}
+
+
+prefetcher = Prefetcher()
+indexer = Indexer()
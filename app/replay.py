@@ -0,0 +1,249 @@
+"""Session recorder and offline replay benchmark.
+
+Record live sessions by setting ``RECORD_DIR``; each session is written to
+``session-<id>-<time>.rec`` with its camera frames (JPEG) and chat inputs,
+timestamped. Or make a recording from a video file:
+
+    python -m app.replay make demo.rec --video clip.mp4 --ask "2:What do you see?" --ask "6:Read the sign"
+
+Replay recordings through the app's frame and chat handlers against the
+local stand-in endpoints (``app.standin``), as several concurrent sessions
+and at real or accelerated speed:
+
+    FPS=10 python -m app.replay run demo.rec --sessions 8 --speed 2 --llm-latency 0.4 --task-latency 0.05
+
+and get throughput, per-frame handler cost, turn latency percentiles and
+memory per session as JSON.
+"""
+import argparse
+import json
+import os
+import resource
+import struct
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+MAGIC = b"PCREC1\n"
+_HEADER = struct.Struct("<cdI")  # kind, timestamp, payload length
+FRAME, CHAT = b"F", b"C"
+
+
+class Recorder:
+    """Appends a session's frames and chat inputs to a compact recording file.
+
+    Frames are stored as JPEG (``quality``) exactly as the handler received
+    them; every record carries its wall-clock timestamp. Safe to use from
+    the frame and chat handler threads at once.
+    """
+
+    def __init__(self, path: Path, quality: int = 85) -> None:
+        self.path = Path(path)
+        self.quality = quality
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_session(cls, directory: str, uid: int) -> "Recorder":
+        return cls(Path(directory) / f"session-{uid}-{int(time.time())}.rec")
+
+    def _write(self, kind: bytes, payload: bytes, ts: Optional[float] = None) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(_HEADER.pack(kind, time.time() if ts is None else ts, len(payload)))
+            self._file.write(payload)
+
+    def frame(self, frame: np.ndarray, ts: Optional[float] = None) -> None:
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ok:
+            self._write(FRAME, buf.tobytes(), ts)
+
+    def chat(self, text: str, ts: Optional[float] = None) -> None:
+        self._write(CHAT, text.encode(), ts)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read(path: Path) -> Iterator[Tuple[bytes, float, bytes]]:
+    """``(kind, timestamp, payload)`` records of a recording, in order."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while header := f.read(_HEADER.size):
+            kind, ts, length = _HEADER.unpack(header)
+            yield kind, ts, f.read(length)
+
+
+def make(path: Path, video: str, asks: List[str], quality: int = 85) -> int:
+    """Write a recording of *video*, with ``"seconds:question"`` chat inputs; returns the frame count."""
+    questions = sorted((float(t), q) for t, _, q in (a.partition(":") for a in asks))
+    cap = cv2.VideoCapture(video)
+    recorder, frames, start = Recorder(path, quality), 0, time.time()
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            offset = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            while questions and questions[0][0] <= offset:
+                recorder.chat(questions.pop(0)[1], start + offset)
+            recorder.frame(frame, start + offset)
+            frames += 1
+        for t, question in questions:
+            recorder.chat(question, start + t)
+    finally:
+        cap.release()
+        recorder.close()
+    return frames
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:  # not Linux: peak instead of current
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values: List[float], scale: float = 1.0) -> dict:
+    if not values:
+        return {}
+    a = np.asarray(values) * scale
+    return {"p50": float(np.percentile(a, 50)), "p95": float(np.percentile(a, 95)),
+            "p99": float(np.percentile(a, 99)), "max": float(a.max())}
+
+
+def run(path: Path, sessions: int = 1, speed: float = 1.0, drain: float = 60.0, host: str = "127.0.0.1",
+        port: int = 8011, task_latency: float = 0.0, task_latency_per_image: float = 0.0, llm_latency: float = 0.0,
+        llm_latency_per_image: float = 0.0, llm_token_latency: float = 0.0) -> dict:
+    """Replay *path* as *sessions* concurrent sessions against the stand-in; returns the report."""
+    # Imported here so the endpoints can be pointed at the stand-in before any client is created
+    from .config import env
+    from .standin import create_app, serve_in_thread
+
+    standin = create_app(task_latency, task_latency_per_image, llm_latency, llm_latency_per_image, llm_token_latency)
+    server = serve_in_thread(standin, host, port)
+    env.end_lang, env.end_task = f"http://{host}:{port}/v1", f"http://{host}:{port}/task"
+    env.end_task_batch = f"http://{host}:{port}/task/batch" if env.end_task_batch else None
+    env.api_key = env.api_key or "standin"
+    env.model_agent, env.model_mllm = env.model_agent or "standin-agent", env.model_mllm or "standin-mllm"
+    env.model_loc = env.model_loc or "standin-loc"
+    env.record_dir = ""
+    import main as handlers  # the Gradio app module; its handlers are driven directly
+
+    records = [(kind, ts, payload) for kind, ts, payload in read(path)]
+    if not records:
+        raise ValueError(f"{path} is empty")
+    frames = [cv2.imdecode(np.frombuffer(p, np.uint8), cv2.IMREAD_COLOR) if k == FRAME else None for k, _, p in records]
+    t0 = records[0][1]
+    costs: List[List[float]] = [[] for _ in range(sessions)]
+    submitted: List[List[Tuple[str, float]]] = [[] for _ in range(sessions)]
+    rss_before = rss_mb()
+
+    def feed(i: int) -> None:
+        sid = f"replay-{i}"
+        start = time.perf_counter()
+        for (kind, ts, payload), frame in zip(records, frames):
+            if speed > 0:
+                delay = (ts - t0) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            if kind == FRAME:
+                began = time.perf_counter()
+                handlers.handle_frame(frame, sid)
+                costs[i].append(time.perf_counter() - began)
+            else:
+                text = payload.decode()
+                submitted[i].append((text, time.time()))
+                handlers.chat_handler(text, sid)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=feed, args=(i,), name=f"replay-{i}") for i in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    fed = time.perf_counter() - started
+    mems = [handlers.get_session_memory(f"replay-{i}") for i in range(sessions)]
+    deadline = time.monotonic() + drain
+    while time.monotonic() < deadline and any(m.is_running or m.pending for m in mems):
+        time.sleep(0.05)
+
+    turns, outcomes = [], Counter()
+    for mem, inputs in zip(mems, submitted):
+        waiting = list(inputs)
+        start_ts = None
+        for step in list(mem.runner_steps):
+            if step.step_type == "processing_start":
+                text = step.details.get("user_input")
+                match = next((j for j, (t, _) in enumerate(waiting) if t == text), None)
+                start_ts = waiting.pop(match)[1] if match is not None else None
+            elif step.step_type in ("final_output", "error", "timeout", "cancelled") and start_ts is not None:
+                outcomes[step.step_type] += 1
+                turns.append(step.timestamp - start_ts)
+                start_ts = None
+    report = {
+        "recording": str(path),
+        "sessions": sessions,
+        "speed": speed,
+        "frames": sum(map(len, costs)),
+        "feed_seconds": fed,
+        "throughput_fps": sum(map(len, costs)) / fed if fed else 0.0,
+        "frame_ms": percentiles([c for cs in costs for c in cs], 1000),
+        "turns": len(turns),
+        "turn_outcomes": dict(outcomes),
+        "turn_seconds": percentiles(turns),
+        "rss_mb_per_session": (rss_mb() - rss_before) / sessions,
+        "frame_buffer_mb_per_session": sum(m.frames.nbytes for m in mems) / sessions / 2**20,
+        "standin": dict(standin.state.stats),
+    }
+    for i in range(sessions):
+        handlers.session_memories.evict(f"replay-{i}")
+    server.should_exit = True
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    mk = commands.add_parser("make", help="make a recording from a video file")
+    mk.add_argument("output", type=Path)
+    mk.add_argument("--video", required=True)
+    mk.add_argument("--ask", action="append", default=[], help='"seconds:question" chat input, repeatable')
+    mk.add_argument("--quality", type=int, default=85)
+    rp = commands.add_parser("run", help="replay a recording against the stand-in endpoints")
+    rp.add_argument("recording", type=Path)
+    rp.add_argument("--sessions", type=int, default=1)
+    rp.add_argument("--speed", type=float, default=1.0, help="playback speed, 0 for as fast as possible")
+    rp.add_argument("--drain", type=float, default=60.0, help="seconds to wait for outstanding answers")
+    rp.add_argument("--port", type=int, default=8011)
+    for name in ("task-latency", "task-latency-per-image", "llm-latency", "llm-latency-per-image", "llm-token-latency"):
+        rp.add_argument(f"--{name}", type=float, default=0.0)
+    rp.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    if args.command == "make":
+        print(f"Wrote {make(args.output, args.video, args.ask, args.quality)} frames to {args.output}")
+        return
+    report = run(args.recording, args.sessions, args.speed, args.drain, port=args.port,
+                 task_latency=args.task_latency, task_latency_per_image=args.task_latency_per_image,
+                 llm_latency=args.llm_latency, llm_latency_per_image=args.llm_latency_per_image,
+                 llm_token_latency=args.llm_token_latency)
+    text = json.dumps(report, indent=2)
+    if args.json:
+        args.json.write_text(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
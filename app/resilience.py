@@ -0,0 +1,151 @@
+import asyncio
+import random
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional
+
+import httpx
+import numpy as np
+import openai
+
+from .config import logger, env
+
+
+class Route(NamedTuple):
+    """Where one attempt goes; empty fields fall back to the caller's model and endpoint."""
+    model: str = ""
+    url: str = ""
+
+
+def parse_routes(spec: str) -> List[Route]:
+    """``"model@url,@url,model"`` style list of alternates."""
+    routes = []
+    for item in spec.split(","):
+        if item.strip():
+            model, _, url = item.strip().partition("@")
+            routes.append(Route(model.strip(), url.strip()))
+    return routes
+
+
+ROUTES: Dict[str, List[Route]] = {name: parse_routes(spec) for name, spec in env.alternates.items()}
+
+
+def routes(tool: str) -> List[Route]:
+    """The primary route followed by the tool's ``ALTERNATES_<TOOL>``."""
+    return [Route(), *ROUTES.get(tool, ())]
+
+
+def retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, (httpx.TransportError, openai.APIConnectionError, openai.InternalServerError,
+                            openai.RateLimitError))
+
+
+class LatencyTracker:
+    """Recent successful request latencies per key."""
+
+    def __init__(self, window: int = 256, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, key: str, seconds: float) -> None:
+        self._samples[key].append(seconds)
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return float(np.quantile(samples, q))
+
+
+class Resilient:
+    """Retries, hedging and alternate routes for model requests.
+
+    ``call`` runs ``attempt(route, hedge)`` until one succeeds, within
+    ``deadline`` seconds overall. Failed attempts that look transient
+    (connection errors, timeouts, 5xx, 429) are retried up to ``attempts``
+    times with full-jitter exponential backoff, rotating through the
+    routes. With hedging on, an attempt still running after the key's recent
+    ``hedge_quantile`` latency gets a duplicate on the next route, and the
+    first reply wins; ``attempt`` should send hedges at background priority
+    so they are shed, not queued, when the endpoint is saturated.
+    """
+
+    def __init__(self, attempts: int = env.retry_attempts, deadline: float = env.retry_deadline,
+                 backoff: float = env.retry_backoff, hedge: bool = env.hedge,
+                 hedge_quantile: float = env.hedge_quantile, hedge_min_delay: float = env.hedge_min_delay) -> None:
+        self.attempts = max(attempts, 1)
+        self.deadline = deadline
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = LatencyTracker()
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        q = self.latency.quantile(key, self.hedge_quantile)
+        return None if q is None else max(q, self.hedge_min_delay)
+
+    async def call(self, key: str, attempt: Callable[[Route, bool], Awaitable[Any]],
+                   routes: List[Route] = (Route(),)) -> Any:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline if self.deadline else float("inf")
+        self.counts["calls"] += 1
+        for n in range(self.attempts):
+            try:
+                return await self._hedged(key, attempt, routes, n, deadline)
+            except Exception as exc:  # noqa: BLE001
+                delay = random.uniform(0, self.backoff * 2 ** n)
+                if n + 1 >= self.attempts or not retryable(exc) or loop.time() + delay >= deadline:
+                    raise
+                self.counts["retries"] += 1
+                logger.debug(f"Retrying {key} in {delay:.2f}s after {type(exc).__name__}: {exc}")
+                await asyncio.sleep(delay)
+
+    async def _timed(self, key: str, attempt: Callable[[Route, bool], Awaitable[Any]], route: Route,
+                     hedge: bool) -> Any:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await attempt(route, hedge)
+        self.latency.observe(key, loop.time() - start)
+        return result
+
+    async def _hedged(self, key: str, attempt: Callable[[Route, bool], Awaitable[Any]], routes: List[Route],
+                      n: int, deadline: float) -> Any:
+        loop = asyncio.get_running_loop()
+        timeout = None if deadline == float("inf") else max(deadline - loop.time(), 0)
+        first = asyncio.ensure_future(self._timed(key, attempt, routes[n % len(routes)], False))
+        pending = {first}
+        try:
+            after = self.hedge_delay(key)
+            if after is not None and (timeout is None or after < timeout):
+                done, _ = await asyncio.wait(pending, timeout=after)
+                if not done:
+                    self.counts["hedges"] += 1
+                    pending.add(asyncio.ensure_future(self._timed(key, attempt, routes[(n + 1) % len(routes)], True)))
+            error: Optional[BaseException] = None
+            while pending:
+                remaining = None if timeout is None else max(deadline - loop.time(), 0)
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError(f"{key} exceeded its {self.deadline:g}s deadline")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.counts["hedge_wins"] += 1
+                        return task.result()
+                    if error is None or task is first:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return dict(self.counts)
+
+
+resilient = Resilient()
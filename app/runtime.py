@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from typing import Any, Optional
+
+from .config import logger, env
+
+
+class Runtime:
+    """One process-wide event loop that runs the agent for every session.
+
+    Each session keeps its own FIFO of pending inputs; the runtime keeps a
+    round-robin queue of sessions that have work. A fixed pool of worker
+    tasks pulls the next session, runs exactly one of its inputs and, if
+    more are pending, puts the session back at the tail. This bounds the
+    number of concurrent ``Runner.run`` calls globally, never runs two
+    inputs of one session at once, and keeps a chatty session from starving
+    the others.
+
+    Each run is its own task (``mem.run_task``) so it can be cancelled
+    without losing the worker; cancellation reaches the run's outstanding
+    model and tool requests.
+    """
+
+    def __init__(self, workers: int = env.agent_workers) -> None:
+        self.workers = workers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready: Optional[asyncio.Queue] = None
+        self._lock = threading.Lock()
+        self.active: int = 0
+        self.cancelled: int = 0
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self.start()
+        return self._loop
+
+    def start(self) -> None:
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+
+            def _runner() -> None:
+                asyncio.set_event_loop(loop)
+                self._ready = asyncio.Queue()
+                for i in range(self.workers):
+                    loop.create_task(self._worker(), name=f"agent-worker-{i}")
+                loop.run_forever()
+
+            threading.Thread(target=_runner, name="agent-runtime", daemon=True).start()
+            self._loop = loop
+
+    def submit(self, mem: Any, text: str, replace: bool = False) -> None:
+        """Queue *text* for *mem*; with *replace*, drop its other inputs and cancel its current run.
+
+        Safe to call from any thread.
+        """
+        self.loop.call_soon_threadsafe(self._enqueue, mem, text, replace)
+
+    def cancel(self, mem: Any) -> None:
+        """Cancel the run in progress for *mem*, if any; safe to call from any thread."""
+        self.loop.call_soon_threadsafe(self._cancel, mem)
+
+    def spawn(self, coro) -> "asyncio.Future":
+        """Run a coroutine on the shared loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _cancel(self, mem: Any) -> None:
+        task = getattr(mem, "run_task", None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.cancelled += 1
+
+    def _enqueue(self, mem: Any, text: str, replace: bool = False) -> None:
+        if mem.closed:
+            return
+        if replace:
+            mem.pending.clear()
+            self._cancel(mem)
+        mem.pending.append(text)
+        if not mem.scheduled:
+            mem.scheduled = True
+            self._ready.put_nowait(mem)
+
+    async def _worker(self) -> None:
+        while True:
+            mem = await self._ready.get()
+            if mem.closed or not mem.pending:
+                mem.scheduled = False
+                continue
+            text = mem.pending.popleft()
+            self.active += 1
+            mem.run_task = asyncio.get_running_loop().create_task(mem.run(text))
+            try:
+                await asyncio.wait({mem.run_task})
+                if not mem.run_task.cancelled() and (exc := mem.run_task.exception()) is not None:
+                    logger.debug(f"Unhandled error in agent worker: {exc}")
+            finally:
+                mem.run_task = None
+                self.active -= 1
+                if mem.pending and not mem.closed:
+                    self._ready.put_nowait(mem)
+                else:
+                    mem.scheduled = False
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "cancelled": self.cancelled,
+            "queued_sessions": self._ready.qsize() if self._ready else 0,
+        }
+
+
+runtime = Runtime()
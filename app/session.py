@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from .config import logger, env
+from .memory import Memory
+
+
+class SessionManager:
+    """Owns the per-WebRTC-id ``Memory`` objects and evicts them.
+
+    Sessions are kept in LRU order and touched on every frame or chat
+    message. A session is evicted when it has been idle longer than
+    ``ttl`` (a disconnected camera stops sending frames, so it goes idle),
+    when more than ``max_sessions`` are live, or while the frame buffers of
+    all sessions together exceed ``max_frame_bytes``.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Memory],
+        ttl: float = env.session_ttl,
+        max_sessions: int = env.max_sessions,
+        max_frame_bytes: int = env.max_frame_mb * 2**20,
+        sweep_interval: float = 5.0,
+    ) -> None:
+        self.factory = factory
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_frame_bytes = max_frame_bytes
+        self.sweep_interval = sweep_interval
+        self._sessions: "OrderedDict[str, Memory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep: float = 0
+        self.created: int = 0
+        self.evicted: int = 0
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Memory:
+        """Return the session's memory, creating it on first use, and mark it active."""
+        now = time.time()
+        with self._lock:
+            mem = self._sessions.get(session_id)
+            if mem is None:
+                mem = self._sessions[session_id] = self.factory()
+                self.created += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            mem.last_active = now
+            if now - self._last_sweep > self.sweep_interval or len(self._sessions) > self.max_sessions:
+                self._last_sweep = now
+                self._sweep(now, keep=session_id)
+        return mem
+
+    def evict(self, session_id: str, reason: str = "manual") -> bool:
+        with self._lock:
+            return self._evict(session_id, reason)
+
+    def _evict(self, session_id: str, reason: str) -> bool:
+        mem = self._sessions.pop(session_id, None)
+        if mem is None:
+            return False
+        mem.close()
+        self.evicted += 1
+        logger.info(f"Evicted session {session_id} ({reason})")
+        return True
+
+    def _sweep(self, now: float, keep: Optional[str] = None) -> None:
+        for sid, mem in list(self._sessions.items()):
+            if sid != keep and now - mem.last_active > self.ttl and not mem.is_running:
+                self._evict(sid, "idle")
+        # LRU order: the head of the dict is the least recently active session
+        while len(self._sessions) > max(self.max_sessions, 1):
+            sid = next(s for s in self._sessions if s != keep)
+            self._evict(sid, "session cap")
+        if self.max_frame_bytes:
+            total = sum(m.frames.nbytes for m in self._sessions.values())
+            for sid in [s for s in self._sessions if s != keep]:
+                if total <= self.max_frame_bytes:
+                    break
+                total -= self._sessions[sid].frames.nbytes
+                self._evict(sid, "frame memory cap")
+
+    def sweep(self) -> None:
+        with self._lock:
+            self._last_sweep = time.time()
+            self._sweep(self._last_sweep)
+
+    def stats(self) -> Dict[str, Any]:
+        """Live counts for monitoring."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "running": sum(m.is_running for m in sessions),
+            "frames": sum(len(m.frames) for m in sessions),
+            "frame_bytes": sum(m.frames.nbytes for m in sessions),
+            "cache_hits": sum(m.cache_stats["hits"] for m in sessions),
+            "cache_misses": sum(m.cache_stats["misses"] for m in sessions),
+            "created": self.created,
+            "evicted": self.evicted,
+        }
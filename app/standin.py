@@ -0,0 +1,151 @@
+"""Local stand-in for the model endpoints, for tests and benchmarks.
+
+    python -m app.standin --port 8001 --task-latency 0.1 --task-latency-per-image 0.01 --llm-latency 0.5
+
+Serves ``POST /task`` (END_TASK) and ``POST /task/batch`` (END_TASK_BATCH)
+with a fixed box around the centre of each image, ``POST
+/v1/chat/completions`` (END_LANG) for both the agent and the MLLM, each
+after a configurable delay, and ``GET /stats`` with request counters.
+
+The chat stand-in answers a user message that comes with tools by calling
+the tool named in the message (``caption`` otherwise), and answers once
+tool results are in; image requests get a canned description. Streaming
+requests are answered as server-sent events, one word per chunk.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import StreamingResponse
+
+
+def fake_detection(image: bytes) -> dict:
+    frame = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    h, w = (frame.shape[0] * 2, frame.shape[1] * 2) if frame is not None else (0, 0)
+    return {"object": [[w * 0.25, h * 0.25, w * 0.75, h * 0.75]]}
+
+
+_call_ids = itertools.count()
+
+
+def fake_tool_call(messages: List[dict], tools: List[dict]) -> Optional[dict]:
+    """A call to the tool named in the last user message, or None once tool results are in."""
+    if not tools or not messages or messages[-1].get("role") != "user":
+        return None
+    text = str(messages[-1].get("content") or "")
+    functions = [t["function"] for t in tools if t.get("type") == "function"]
+    names = [f["name"] for f in functions]
+    # longest match, so "video_qa" is not taken for "qa"
+    named = [n for n in names if n in text.lower()]
+    name = max(named, key=len) if named else "caption" if "caption" in names else names[0]
+    params = next(f for f in functions if f["name"] == name).get("parameters") or {}
+    args = {
+        key: 2 if spec.get("type") == "integer" else text
+        for key, spec in params.get("properties", {}).items() if key in params.get("required", [])
+    }
+    return {"id": f"call_{next(_call_ids)}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+
+
+def fake_answer(messages: List[dict], images: int) -> str:
+    if images:
+        return f"A stand-in description of {images} image(s): a desk with a laptop, a mug and a notebook."
+    results = sum(m.get("role") == "tool" for m in messages)
+    return f"<think>The stand-in considered {results} tool result(s).</think>\n\nHere is a stand-in answer based on {results} tool result(s)."
+
+
+def create_app(task_latency: float = 0.0, task_latency_per_image: float = 0.0, llm_latency: float = 0.0,
+               llm_latency_per_image: float = 0.0, llm_token_latency: float = 0.0) -> FastAPI:
+    app = FastAPI(title="perceptual-copilot stand-in")
+    app.state.stats = {"task_requests": 0, "task_images": 0, "batch_requests": 0, "chat_requests": 0, "chat_images": 0}
+
+    @app.post("/task")
+    async def task(name: str = Form(...), file: UploadFile = File(...)):
+        app.state.stats["task_requests"] += 1
+        app.state.stats["task_images"] += 1
+        await asyncio.sleep(task_latency + task_latency_per_image)
+        return {"result": fake_detection(await file.read())}
+
+    @app.post("/task/batch")
+    async def task_batch(name: str = Form(...), files: List[UploadFile] = File(...)):
+        app.state.stats["batch_requests"] += 1
+        app.state.stats["task_images"] += len(files)
+        await asyncio.sleep(task_latency + task_latency_per_image * len(files))
+        return {"results": [fake_detection(await f.read()) for f in files]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        images = sum(
+            part.get("type") == "image_url"
+            for m in messages if isinstance(m.get("content"), list) for part in m["content"]
+        )
+        app.state.stats["chat_requests"] += 1
+        app.state.stats["chat_images"] += images
+        await asyncio.sleep(llm_latency + llm_latency_per_image * images)
+        call = fake_tool_call(messages, body.get("tools") or [])
+        text = "" if call else fake_answer(messages, images)
+        head = {"id": f"chatcmpl-{next(_call_ids)}", "created": int(time.time()), "model": body.get("model", "standin")}
+        finish = "tool_calls" if call else "stop"
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": text or None, **({"tool_calls": [call]} if call else {})}
+            return {**head, "object": "chat.completion", "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+
+        async def events():
+            def chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+                choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                return f"data: {json.dumps({**head, 'object': 'chat.completion.chunk', 'choices': [choice]})}\n\n"
+
+            if call:
+                yield chunk({"role": "assistant", "tool_calls": [{"index": 0, **call}]})
+            for i, word in enumerate(text.split(" ")):
+                if i and llm_token_latency:
+                    await asyncio.sleep(llm_token_latency)
+                yield chunk({"role": "assistant", "content": word} if not i else {"content": " " + word})
+            yield chunk({}, finish)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def serve_in_thread(app: FastAPI, host: str = "127.0.0.1", port: int = 8001) -> uvicorn.Server:
+    """Start *app* on a daemon thread and return once it accepts connections."""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--task-latency", type=float, default=0.0, help="seconds per detector request")
+    parser.add_argument("--task-latency-per-image", type=float, default=0.0, help="extra seconds per image")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds to the first token of a chat request")
+    parser.add_argument("--llm-latency-per-image", type=float, default=0.0, help="extra seconds per image")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="seconds between streamed words")
+    args = parser.parse_args()
+    app = create_app(args.task_latency, args.task_latency_per_image, args.llm_latency, args.llm_latency_per_image,
+                     args.llm_token_latency)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
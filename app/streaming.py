@@ -0,0 +1,65 @@
+OPEN, CLOSE = "<think>", "</think>"
+
+
+def _partial_tag(text: str) -> int:
+    """Length of the longest suffix of *text* that could be the start of a think tag."""
+    for n in range(min(len(text), len(CLOSE) - 1), 0, -1):
+        if OPEN.startswith(text[-n:]) or CLOSE.startswith(text[-n:]):
+            return n
+    return 0
+
+
+class ThinkFilter:
+    """Hides ``<think>...</think>`` reasoning from model text as it streams.
+
+    ``feed`` takes each text delta and returns the visible answer so far.
+    Tags split across deltas are held back until they can be told apart
+    from ordinary text. Some chat templates open the think block in the
+    prompt, so the output starts inside it and only the closing tag
+    appears: pass ``thinking=True`` for those models. Without it, text seen
+    before an unmatched ``</think>`` is shown and then withdrawn once the
+    tag arrives, which matches how the final answer is cut.
+    """
+
+    def __init__(self, thinking: bool = False) -> None:
+        self.thinking = thinking
+        self._text = ""
+        self._tail = ""
+
+    @property
+    def text(self) -> str:
+        return self._text.lstrip()
+
+    def feed(self, delta: str) -> str:
+        buf = self._tail + delta
+        while buf:
+            if self.thinking:
+                end = buf.find(CLOSE)
+                if end < 0:
+                    keep = _partial_tag(buf)
+                    buf = buf[len(buf) - keep:] if keep else ""
+                    break
+                buf, self.thinking = buf[end + len(CLOSE):], False
+                continue
+            start, end = buf.find(OPEN), buf.find(CLOSE)
+            if end >= 0 and (start < 0 or end < start):
+                # closing tag without an opening one: everything so far was reasoning
+                self._text, buf = "", buf[end + len(CLOSE):]
+            elif start >= 0:
+                self._text += buf[:start]
+                buf, self.thinking = buf[start + len(OPEN):], True
+            else:
+                keep = _partial_tag(buf)
+                self._text += buf[:len(buf) - keep]
+                buf = buf[len(buf) - keep:]
+                break
+        self._tail = buf
+        return self.text
+
+    def flush(self) -> str:
+        """Release held-back text at the end of a response."""
+        if not self.thinking:
+            self._text += self._tail
+        self._tail = ""
+        return self.text
+
@@ -1,49 +1,170 @@
+import asyncio
 import datetime
+import functools
 import json
-import cv2
-import httpx
+import numpy as np
 from app.config import env
-from app.utils import image_w_box, encode_image
+from app.client import http_client, llm_client
+from app.utils import image_w_box, encode_frame, encode_frames, encode_mosaics, get_profile
 from agents import RunContextWrapper, function_tool
-from app.memory import Memory,Snapshot
+from app.memory import Memory,Snapshot,current_slot
+from app.cache import result_cache
+from app.batching import BatchDispatcher
+from app.limits import BACKGROUND, BULK, INTERACTIVE, Busy, lang_limiter, task_limiter
+from app.resilience import Route, resilient, routes
+from app.metrics import metrics
 
 
 
 
-def task(name, image):
-    resp = httpx.post(f"{env.end_task}",
-        data={"name": name},
-        files={"file": ("frame.jpg", image.tobytes(), "image/jpeg")},
-        timeout=10,
-        headers={"Authorization": env.api_key},
-    )
-    resp.raise_for_status()
-    return resp.json()['result']
+async def task(name, image: bytes):
+    if env.end_task_batch:
+        return await task_batcher.submit(name, image)
 
-def completion(messages, model):
-    response = env.client.chat.completions.create(
-        model=model,
-        messages=messages
-    )
-    return response.choices[0].message.content
+    async def attempt(route: Route, hedge: bool):
+        async with task_limiter.slot(BACKGROUND if hedge else INTERACTIVE):
+            with metrics.timer("copilot_request_seconds", endpoint="task", tool="localize"):
+                resp = await http_client().post(route.url or env.end_task,
+                    data={"name": route.model or name},
+                    files={"file": ("frame.jpg", image, "image/jpeg")},
+                    timeout=10,
+                    headers={"Authorization": env.api_key},
+                )
+        resp.raise_for_status()
+        return resp.json()['result']
+    metrics.observe("copilot_payload_bytes", len(image), endpoint="task", tool="localize")
+    return await resilient.call("task", attempt, routes("localize"))
 
+async def task_batch(name, images: list[bytes]):
+    # alternates in ALTERNATES_LOCALIZE are single-image endpoints, so batches only retry and hedge
+    async def attempt(route: Route, hedge: bool):
+        async with task_limiter.slot(BACKGROUND if hedge else INTERACTIVE):
+            with metrics.timer("copilot_request_seconds", endpoint="task_batch", tool="localize"):
+                resp = await http_client().post(f"{env.end_task_batch}",
+                    data={"name": name},
+                    files=[("files", (f"frame{i}.jpg", image, "image/jpeg")) for i, image in enumerate(images)],
+                    timeout=10,
+                    headers={"Authorization": env.api_key},
+                )
+        resp.raise_for_status()
+        return resp.json()['results']
+    metrics.observe("copilot_payload_bytes", sum(map(len, images)), endpoint="task_batch", tool="localize")
+    return await resilient.call("task_batch", attempt)
 
-def completion_image(images, prompt, model):
+# Coalesces concurrent localize calls from all sessions into batched detector requests
+task_batcher = BatchDispatcher(task_batch)
+
+async def completion(messages, model, priority=INTERACTIVE, tool="default"):
+    async def attempt(route: Route, hedge: bool):
+        # retries are done by the resilience layer, with jitter and a shared deadline
+        client = llm_client(route.url).with_options(max_retries=0)
+        async with lang_limiter.slot(BACKGROUND if hedge else priority):
+            with metrics.timer("copilot_request_seconds", endpoint="mllm", tool=tool):
+                response = await client.chat.completions.create(
+                    model=route.model or model,
+                    messages=messages
+                )
+        return response.choices[0].message.content
+    return await resilient.call(f"mllm:{tool}", attempt, routes(tool))
+
+
+async def completion_image(images, prompt, model, keys=None, profile="default", stamps=None, priority=None,
+                           tool="default"):
+    prof = get_profile(profile)
+    keys = keys or [None] * len(images)
+    if env.mosaic and stamps and len(images) > 1:
+        n_mosaics = -(-len(images) // (env.mosaic_grid[0] * env.mosaic_grid[1]))
+        # encode off the loop so parallel tool calls are not serialized behind it
+        with metrics.timer("copilot_encode_seconds", tool=tool):
+            encoded = await asyncio.to_thread(encode_mosaics, images, keys, stamps, prof, env.encode_max_pixels // n_mosaics)
+        prompt += (
+            f" The {len(images)} video frames are tiled into {len(encoded)} grid image(s), in chronological order "
+            "left to right, top to bottom; each tile is labelled with its capture time."
+        )
+    else:
+        per_image = 1 + prof.tiles ** 2 if prof.tiles > 1 else 1
+        max_pixels = env.encode_max_pixels // (len(images) * per_image) if env.encode_max_pixels else 0
+        with metrics.timer("copilot_encode_seconds", tool=tool):
+            encoded = await asyncio.to_thread(
+                lambda: [e for image, key in zip(images, keys) for e in encode_frames(image, key, prof, max_pixels)]
+            )
+        if len(images) > 1:
+            prompt += f" The {len(images)} images are video frames in chronological order."
     messages = [
         {
             "role": "user",
             "content": [
                 {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}},
+                *({"type": "image_url", "image_url": {"url": f"data:{e.mime};base64,{e.b64}"}} for e in encoded),
             ],
         }
-        for b64, mime in map(encode_image, images)
     ]
-    return completion(messages, model=model)
+    metrics.observe("copilot_payload_bytes", sum(len(e.b64) for e in encoded), endpoint="mllm", tool=tool)
+    if priority is None:
+        priority = BULK if len(images) > 1 else INTERACTIVE
+    return await completion(messages, model=model, priority=priority, tool=tool)
+
+CAPTION_PROMPT = "Describe the image with rich details but in a concise manner."
+
+
+async def ask_frame(mem: Memory, tool: str, prompt: str, question: str = "", profile: str = "default",
+                    background: bool = False) -> str:
+    """Run *prompt* on the newest frame, reusing a cached result while the scene is unchanged.
+
+    Background (prefetch) calls do not count towards the cache hit/miss statistics
+    and are shed rather than queued when the MLLM endpoint is saturated.
+    """
+    if not background and tool == "caption" and mem.prefetching and mem.prefetch_task:
+        # a background caption of the view is in flight; wait for it rather than duplicate it
+        await asyncio.shield(mem.prefetch_task)
+    frame, phash = mem.frames[-1], mem.frames.phash(-1)
+    cached = env.result_cache and tool in env.result_cache_tools
+    if cached:
+        if (hit := result_cache.get(mem.uid, tool, question, phash, count=not background)) is not None:
+            if not background:
+                mem.cache_stats["hits"] += 1
+            return hit
+        if not background:
+            mem.cache_stats["misses"] += 1
+    result = await completion_image([frame], prompt, env.model_mllm, keys=[mem.frames.key(frame)], profile=profile,
+                                    priority=BACKGROUND if background else INTERACTIVE, tool=tool)
+    if cached:
+        result_cache.put(mem.uid, tool, question, phash, result)
+    return result
+
+def tool_slot(fn):
+    """Run a tool under its session's concurrency cap, keeping its snapshots in call order.
+
+    The agent runs all tool calls of one turn concurrently; the slot is
+    reserved before the first await, so slots follow the order of the calls.
+    A call that exceeds ``TOOL_TIMEOUT`` is cancelled, along with its
+    requests, and the model is told it timed out; one shed by admission
+    control returns a "busy" answer right away.
+    """
+    @functools.wraps(fn)
+    async def wrapper(ctx: RunContextWrapper[Memory], *args, **kwargs):
+        mem = ctx.context
+        slot = mem.open_slot()
+        token = current_slot.set(slot)
+        try:
+            async with mem.tool_slots:
+                with metrics.timer("copilot_tool_seconds", tool=fn.__name__, session=mem.uid):
+                    return await asyncio.wait_for(fn(ctx, *args, **kwargs), env.tool_timeout or None)
+        except asyncio.TimeoutError:
+            mem.post(Snapshot(sender=fn.__name__, data="_Timed out_"))
+            return f"{fn.__name__} timed out after {env.tool_timeout:g}s; its result is not available."
+        except Busy as exc:
+            mem.post(Snapshot(sender=fn.__name__, data="_Busy, please try again shortly_"))
+            return f"{fn.__name__} is unavailable because the vision service is overloaded ({exc}). Ask the user to try again shortly."
+        finally:
+            current_slot.reset(token)
+            mem.close_slot(slot)
+    return wrapper
 
 # ------------------------ Function Tools ------------------------
 @function_tool
-def caption(wrapper: RunContextWrapper[Memory]) -> str:  
+@tool_slot
+async def caption(wrapper: RunContextWrapper[Memory]) -> str:  
     """
     Generate a descriptive caption for the most recent frame, record it as a snapshot, and return it.
     Returns:
@@ -51,13 +172,13 @@ def caption(wrapper: RunContextWrapper[Memory]) -> str:
             The generated caption for the current view (i.e., the latest frame).
     """
     mem = wrapper.context
-    prompt = "Describe the image with rich details but in a concise manner."
-    result = completion_image([mem.frames[-1]], prompt, env.model_mllm)
-    mem.snapshots.append(Snapshot(sender='caption', data=result))
+    result = await ask_frame(mem, "caption", CAPTION_PROMPT, profile="caption")
+    mem.post(Snapshot(sender='caption', data=result))
     return result
 
 @function_tool
-def ocr(wrapper: RunContextWrapper[Memory]) -> str:  
+@tool_slot
+async def ocr(wrapper: RunContextWrapper[Memory]) -> str:  
     """
     Perform OCR on the most recent frame, record it as a snapshot, and return the extracted text.
     Returns:
@@ -66,12 +187,15 @@ def ocr(wrapper: RunContextWrapper[Memory]) -> str:
     """
     mem = wrapper.context
     prompt = "Extract all text from image/payslip without miss anything."
-    result = completion_image([mem.frames[-1]], prompt, env.model_mllm)
-    mem.snapshots.append(Snapshot(sender='ocr', data=result))
+    if get_profile("ocr").tiles > 1:
+        prompt += " The first image is the full view; the others are zoomed crops of it in reading order."
+    result = await ask_frame(mem, "ocr", prompt, profile="ocr")
+    mem.post(Snapshot(sender='ocr', data=result))
     return result
 
 @function_tool
-def qa(wrapper: RunContextWrapper[Memory], question: str) -> str:  
+@tool_slot
+async def qa(wrapper: RunContextWrapper[Memory], question: str) -> str:  
     """
     Answer a question based on the most recent frame, record it as a snapshot, and return the answer.
 
@@ -83,13 +207,14 @@ def qa(wrapper: RunContextWrapper[Memory], question: str) -> str:
     """
     mem = wrapper.context
     prompt = f"Answer the question based on the image. Question: {question}"
-    result = completion_image([mem.frames[-1]], prompt, env.model_mllm)
-    mem.snapshots.append(Snapshot(sender='qa', data=result))
+    result = await ask_frame(mem, "qa", prompt, question=question)
+    mem.post(Snapshot(sender='qa', data=result))
     return result
 
 
 @function_tool
-def localize(wrapper: RunContextWrapper[Memory]) -> str:
+@tool_slot
+async def localize(wrapper: RunContextWrapper[Memory]) -> str:
     """
     Localize all objects in the most recent frame
     Returns:
@@ -98,15 +223,21 @@ def localize(wrapper: RunContextWrapper[Memory]) -> str:
             the format is {name:list of bboxes}
     """
     mem = wrapper.context
-    frame = mem.frames[-1]
-    _, img = cv2.imencode('.jpg', frame)
-    objxbox = task(env.model_loc, img)
-    mem.snapshots.append(Snapshot(sender='localize', data=image_w_box(frame, objxbox)))
+    frame, phash, ts = mem.frames[-1], mem.frames.phash(-1), mem.frames.timestamp(-1)
+    # Reuse the previous detection while optical flow can follow it; re-detect on drift, age or scene cut
+    objxbox = mem.tracker.track(frame, phash, ts) if env.track else None
+    if objxbox is None:
+        encoded = await asyncio.to_thread(encode_frame, frame, mem.frames.key(frame))
+        objxbox = await task(env.model_loc, encoded.data)
+        mem.tracker.reset(objxbox, frame, phash, ts)
+    blob = await asyncio.to_thread(lambda: mem.blobs.put(image_w_box(frame, objxbox)))
+    mem.post(Snapshot(sender='localize', data=blob))
     return json.dumps(objxbox, indent=2)
 
 
 @function_tool
-def time(wrapper: RunContextWrapper[Memory]) -> str:  
+@tool_slot
+async def time(wrapper: RunContextWrapper[Memory]) -> str:  
     """
     Get the current time, record it as a snapshot, and return the time.
     Returns:
@@ -115,10 +246,10 @@ def time(wrapper: RunContextWrapper[Memory]) -> str:
     """
     mem = wrapper.context
     result = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    mem.snapshots.append(Snapshot(sender='time', data=result))
+    mem.post(Snapshot(sender='time', data=result))
     return result
 
-def sample_frames(mem: Memory, n: int) -> list:
+def sample_frames(mem: Memory, n: int) -> tuple[list, list, list]:
     """
     Sample frames from the past n seconds of video.
     
@@ -126,19 +257,46 @@ def sample_frames(mem: Memory, n: int) -> list:
         mem (Memory): The memory context containing frames.
         n (int): Number of seconds to look back for video frames.
     Returns:
-        list: Sampled frames from the video sequence.
+        tuple: Sampled frames, their cache keys and capture timestamps, oldest first.
+            Frames older than the in-memory buffer come from the session's archive, if enabled.
     """
     if len(mem.frames) == 0:
-        return []
+        return [], [], []
     
-    available_frames = min(n * env.fps, len(mem.frames))
-    recent_frames = mem.frames[-available_frames:]
-    sampled_frames = recent_frames[::env.fps // 2]
+    count = max(mem.frames.span(n), 1)
+    if env.sample_mode == "keyframe":
+        sampled_frames = mem.frames.keyframes(count, limit=env.sample_max)
+    else:
+        # by capture time, not stride: motion admission stores far fewer than FPS frames of a static scene
+        sampled_frames = mem.frames.spaced(count, 0.5)
+    keys, stamps = mem.frames.keys(sampled_frames), mem.frames.times(sampled_frames)
+
+    start, oldest = datetime.datetime.now().timestamp() - n, mem.frames.timestamp(0)
+    if mem.archive is not None and start < oldest:
+        archived = mem.archive.window(start, oldest, limit=env.sample_max)
+        sampled_frames = [f for f, _, _ in archived] + sampled_frames
+        keys = [k for _, k, _ in archived] + keys
+        stamps = [t for _, _, t in archived] + stamps
     
-    return sampled_frames
+    return sampled_frames, keys, stamps
+
+def frames_between(mem: Memory, start: float, end: float, limit: int) -> tuple[list, list, list]:
+    """Up to *limit* frames (with keys and timestamps) captured in ``[start, end)``, from the buffer or the archive."""
+    frames = mem.frames.between(start, end)
+    keys, stamps = mem.frames.keys(frames), mem.frames.times(frames)
+    if mem.archive is not None and len(mem.frames) and start < mem.frames.timestamp(0):
+        archived = mem.archive.window(start, min(end, mem.frames.timestamp(0)))
+        frames = [f for f, _, _ in archived] + frames
+        keys = [k for _, k, _ in archived] + keys
+        stamps = [t for _, _, t in archived] + stamps
+    if limit and len(frames) > limit:
+        picks = np.linspace(0, len(frames) - 1, limit).round().astype(int)
+        frames, keys, stamps = [frames[i] for i in picks], [keys[i] for i in picks], [stamps[i] for i in picks]
+    return frames, keys, stamps
 
 @function_tool
-def video_caption(wrapper: RunContextWrapper[Memory], n=2) -> str:
+@tool_slot
+async def video_caption(wrapper: RunContextWrapper[Memory], n=2) -> str:
     """
     Generate a descriptive caption for a video sequence from the past n seconds of frames.
     The n is a required parameter that specifies how many seconds of video frames to consider.
@@ -150,18 +308,20 @@ def video_caption(wrapper: RunContextWrapper[Memory], n=2) -> str:
             The generated caption for the video sequence from the past n seconds.
     """
     mem = wrapper.context
-    sampled_frames = sample_frames(mem, n)
+    sampled_frames, keys, stamps = sample_frames(mem, n)
     
     if len(sampled_frames) == 0:
         return "No frames available for video caption."
     
     prompt = "Describe this video sequence focusing on any changes or actions that occur over time."
-    result = completion_image(sampled_frames, prompt, env.model_mllm)
-    mem.snapshots.append(Snapshot(sender='video caption', data=result))
+    result = await completion_image(sampled_frames, prompt, env.model_mllm, keys=keys, profile="video", stamps=stamps,
+                                    tool="video_caption")
+    mem.post(Snapshot(sender='video caption', data=result))
     return result
 
 @function_tool
-def video_qa(wrapper: RunContextWrapper[Memory], question: str, n=2) -> str:
+@tool_slot
+async def video_qa(wrapper: RunContextWrapper[Memory], question: str, n=2) -> str:
     """
     Answer a question based on a video sequence from the past n seconds of frames.
     
@@ -173,12 +333,52 @@ def video_qa(wrapper: RunContextWrapper[Memory], question: str, n=2) -> str:
             The answer to the question based on the video sequence from the past n seconds.
     """
     mem = wrapper.context
-    sampled_frames = sample_frames(mem, n)
+    sampled_frames, keys, stamps = sample_frames(mem, n)
     
     if len(sampled_frames) == 0:
         return "No frames available for video Q&A."
     
     prompt = f"Answer the question based on this video sequence. Question: {question}"
-    result = completion_image(sampled_frames, prompt, env.model_mllm)
-    mem.snapshots.append(Snapshot(sender='video qa', data=result))
+    result = await completion_image(sampled_frames, prompt, env.model_mllm, keys=keys, profile="video", stamps=stamps,
+                                    tool="video_qa")
+    mem.post(Snapshot(sender='video qa', data=result))
+    return result
+
+@function_tool
+@tool_slot
+async def recall(wrapper: RunContextWrapper[Memory], query: str, question: str) -> str:
+    """
+    Find when something was seen earlier in the video (beyond the last few seconds) and answer a question
+    about those moments. Use this for questions like "when did I last see my keys?".
+
+    Args:
+        query (str): What to look for, e.g. "keys on a table" or "a red car".
+        question (str): The question to answer about the matching moments.
+    Returns:
+        str:
+            The matching time ranges and the answer based on the frames from those moments.
+    """
+    mem = wrapper.context
+    matches = await mem.index.search(query, k=env.recall_ranges, now=datetime.datetime.now().timestamp())
+    if not matches:
+        return "Nothing matching was found in the indexed video history."
+
+    def fmt(t: float) -> str:
+        return datetime.datetime.fromtimestamp(t).strftime("%H:%M:%S")
+
+    spans = "; ".join(f"{fmt(m.start)}-{fmt(m.end)}" + (f" ({m.text})" if m.text else "") for m in matches)
+    frames, keys, stamps = [], [], []
+    for m in sorted(matches, key=lambda m: m.start):
+        f, k, t = frames_between(mem, m.start, m.end, limit=max(env.sample_max // len(matches), 1))
+        frames, keys, stamps = frames + f, keys + k, stamps + t
+
+    if frames:
+        prompt = f"These frames were captured at the moments matching '{query}'. Answer the question. Question: {question}"
+        answer = await completion_image(frames, prompt, env.model_mllm, keys=keys, profile="video", stamps=stamps,
+                                        tool="recall")
+    else:
+        # frames have aged out; answer from the stored descriptions alone
+        answer = await completion([{"role": "user", "content": f"Moments matching '{query}': {spans}. Question: {question}"}], env.model_mllm)
+    result = f"Matching moments: {spans}\n{answer}"
+    mem.post(Snapshot(sender='recall', data=result))
     return result
@@ -0,0 +1,96 @@
+from typing import Dict, List, Optional
+import cv2
+import numpy as np
+
+from .config import env
+from .motion import hamming
+
+
+class BoxTracker:
+    """Carries the last detection forward with sparse Lucas-Kanade optical flow.
+
+    ``reset`` stores a detector result with corner features sampled inside
+    each box. ``track`` moves every box by the median flow of its features
+    and returns the shifted boxes, or None when the detector should run
+    again: no detection yet, the detection is older than ``max_age``
+    seconds, the frame hash jumped by more than ``max_cut`` bits (a scene
+    cut), or the share of features that survive a forward-backward check
+    drops below ``min_confidence`` in any box.
+    """
+
+    scale = 0.5  # work on half-resolution grayscale
+    lk_params = dict(winSize=(15, 15), maxLevel=2,
+                     criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+    def __init__(self, min_confidence: float = env.track_min_confidence, max_age: float = env.track_max_age,
+                 max_cut: int = env.track_max_cut) -> None:
+        self.min_confidence = min_confidence
+        self.max_age = max_age
+        self.max_cut = max_cut
+        self.confidence: float = 0.0
+        self._gray: Optional[np.ndarray] = None
+        self._labels: List[str] = []
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+        self._points: List[np.ndarray] = []
+        self._phash: int = 0
+        self._detected_at: float = 0
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+    def reset(self, objxbox: Dict[str, list], frame: np.ndarray, phash: int, ts: float) -> None:
+        """Start tracking a fresh detector result for *frame*."""
+        self._gray = self._prepare(frame)
+        self._labels = [label for label, boxes in objxbox.items() for _ in boxes]
+        self._boxes = np.array([b for boxes in objxbox.values() for b in boxes], dtype=np.float32).reshape(-1, 4)
+        self._points = [self._features(box * self.scale) for box in self._boxes]
+        self._phash, self._detected_at = phash, ts
+        self.confidence = 1.0
+
+    def _features(self, box: np.ndarray) -> np.ndarray:
+        h, w = self._gray.shape
+        x1, y1, x2, y2 = np.clip(box, 0, [w, h, w, h]).astype(int)
+        roi = self._gray[y1:y2, x1:x2]
+        if roi.shape[0] < 8 or roi.shape[1] < 8:
+            return np.zeros((0, 1, 2), dtype=np.float32)
+        pts = cv2.goodFeaturesToTrack(roi, maxCorners=20, qualityLevel=0.01, minDistance=3)
+        if pts is None:
+            return np.zeros((0, 1, 2), dtype=np.float32)
+        return pts + np.array([x1, y1], dtype=np.float32)
+
+    def track(self, frame: np.ndarray, phash: int, ts: float) -> Optional[Dict[str, list]]:
+        if self._gray is None or not self._labels:
+            return None
+        if ts - self._detected_at > self.max_age or hamming(phash, self._phash) > self.max_cut:
+            return None
+        gray = self._prepare(frame)
+        counts = [len(p) for p in self._points]
+        if min(counts) == 0:
+            return None
+        prev = np.concatenate(self._points)
+        nxt, status, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, prev, None, **self.lk_params)
+        back, status_back, _ = cv2.calcOpticalFlowPyrLK(gray, self._gray, nxt, None, **self.lk_params)
+        good = (status.ravel() == 1) & (status_back.ravel() == 1) & (np.abs(prev - back).reshape(-1, 2).max(axis=1) < 1.0)
+
+        boxes, points, confidence = [], [], 1.0
+        for box, start, count in zip(self._boxes, np.cumsum([0] + counts[:-1]), counts):
+            ok = good[start:start + count]
+            confidence = min(confidence, ok.mean())
+            if not ok.any():
+                return None
+            shift = np.median((nxt - prev)[start:start + count][ok].reshape(-1, 2), axis=0) / self.scale
+            boxes.append(box + np.tile(shift, 2))
+            points.append(nxt[start:start + count][ok])
+        self.confidence = float(confidence)
+        if confidence < self.min_confidence:
+            return None
+        self._gray, self._boxes, self._points, self._phash = gray, np.array(boxes, dtype=np.float32), points, phash
+        result: Dict[str, list] = {}
+        for label, box in zip(self._labels, self._boxes):
+            result.setdefault(label, []).append([round(float(v), 1) for v in box])
+        return result
+
+    def clear(self) -> None:
+        self._gray = None
+        self._labels, self._points = [], []
@@ -1,8 +1,14 @@
 from PIL import Image
 import base64
+from dataclasses import dataclass, replace
+from datetime import datetime
+from functools import lru_cache
+from typing import Hashable, Optional
 import supervision as sv
 import numpy as np
 import cv2
+from .cache import LRUCache
+from .config import env
 colors = sv.ColorPalette.from_hex(
     [
         "#a1c9f4",
@@ -28,45 +34,182 @@ colors = sv.ColorPalette.from_hex(
     ]
 )
 
-def image_w_box(image,objxbox):
+# Annotators draw palette colours as BGR; swapping channels lets them draw straight onto RGB frames
+rgb_colors = sv.ColorPalette([sv.Color(r=c.b, g=c.g, b=c.r) for c in colors.colors])
 
-    box_annotator = sv.BoxCornerAnnotator(thickness=10, corner_length=30, color=colors)
-    label_annotator = sv.LabelAnnotator(color=colors)
-    mask_annotator = sv.MaskAnnotator(opacity=0.2, color=colors)
 
-    xyxys = np.array([v for boxes in objxbox.values() for v in boxes])
-    unique_labels = sorted(objxbox.keys())
-    class_id_map = dict(enumerate(unique_labels))
-    labels = [l for l, boxes in objxbox.items() for _ in boxes]
-    class_id = [list(class_id_map.values()).index(label) for label in labels]
+@lru_cache(maxsize=1)
+def _annotators():
+    return (
+        sv.BoxCornerAnnotator(thickness=10, corner_length=30, color=rgb_colors),
+        sv.LabelAnnotator(color=rgb_colors),
+    )
+
+
+def shade_boxes(image: np.ndarray, xyxy: np.ndarray, class_id: np.ndarray, palette: sv.ColorPalette, opacity: float = 0.2) -> None:
+    """Blend each box with its class colour in place, touching only the pixels inside the box."""
+    h, w = image.shape[:2]
+    boxes = np.clip(xyxy, 0, [w, h, w, h]).astype(int)
+    for (x1, y1, x2, y2), cid in zip(boxes, class_id):
+        roi = image[y1:y2, x1:x2]
+        if roi.size:
+            color = np.array(palette.by_idx(int(cid)).as_bgr(), dtype=np.float32)
+            roi[:] = (roi * (1 - opacity) + color * opacity).astype(image.dtype)
 
-    masks = np.zeros((len(xyxys), image.shape[0], image.shape[1]), dtype=bool)
-    for i, (x1, y1, x2, y2) in enumerate(xyxys):
-        masks[i, int(y1):int(y2), int(x1):int(x2)] = labels[i]
 
-    if len(xyxys) == 0:
+def image_w_box(image, objxbox, inplace: bool = False):
+    """Draw *objxbox* (``{label: [xyxy, ...]}``) on an RGB image.
+
+    Cost scales with the boxes' area rather than with the number of
+    detections times the frame size. With *inplace* the image is annotated
+    directly, otherwise a copy is.
+    """
+    labels = np.array([l for l, boxes in objxbox.items() for _ in boxes])
+    if len(labels) == 0:
         return image
-    detections = sv.Detections(
-        xyxy=xyxys,
-        mask=masks,
-        class_id=np.array(class_id),
-    )
-    # Convert RGB to BGR for annotation
-    image_bgr = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    # After annotation, convert back to RGB
-    annotated_image = box_annotator.annotate(scene=image_bgr.copy(), detections=detections)
-    annotated_image = label_annotator.annotate(scene=annotated_image, detections=detections, labels=labels)
-    annotated_image = mask_annotator.annotate(scene=annotated_image, detections=detections)
+    xyxys = np.array([v for boxes in objxbox.values() for v in boxes], dtype=float).reshape(-1, 4)
+    _, class_id = np.unique(labels, return_inverse=True)
+    detections = sv.Detections(xyxy=xyxys, class_id=class_id)
+
+    annotated = image if inplace else np.array(image, copy=True)
+    shade_boxes(annotated, xyxys, class_id, rgb_colors)
+    box_annotator, label_annotator = _annotators()
+    annotated = box_annotator.annotate(scene=annotated, detections=detections)
+    return label_annotator.annotate(scene=annotated, detections=detections, labels=labels.tolist())
+
+
+@dataclass
+class Encoded:
+    data: bytes
+    mime: str
+    _b64: Optional[str] = None
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.data).decode('utf-8')
+        return self._b64
+
+    @property
+    def nbytes(self) -> int:
+        # raw bytes plus the base64 text once it has been materialised
+        return len(self.data) * 7 // 3
+
+
+@dataclass(frozen=True)
+class Profile:
+    """How frames are encoded for one kind of request."""
+    max_side: int = 0   # longest side in pixels, 0 keeps full resolution
+    quality: int = 95   # JPEG quality
+    tiles: int = 1      # >1 also sends a tiles x tiles grid of full-resolution crops
+
+    @classmethod
+    def parse(cls, spec: str, base: Optional["Profile"] = None) -> "Profile":
+        """Apply ``"max_side=512,quality=75"`` style overrides on top of *base*."""
+        fields = {k.strip(): int(v) for k, v in (kv.split("=", 1) for kv in spec.split(",") if kv.strip())}
+        return replace(base or cls(), **fields)
+
+
+PROFILES = {
+    "default": Profile(),
+    "caption": Profile(max_side=512, quality=75),
+    "video": Profile(max_side=384, quality=70),
+    "ocr": Profile(quality=95),
+}
+PROFILES.update({name: Profile.parse(spec, PROFILES.get(name)) for name, spec in env.encode_profiles.items()})
+
+
+def get_profile(name: str) -> Profile:
+    return PROFILES.get(name, PROFILES["default"])
 
-    return cv2.cvtColor(annotated_image, cv2.COLOR_BGR2RGB)
 
+def fit(height: int, width: int, max_side: int = 0, max_pixels: int = 0) -> tuple[int, int]:
+    """Output size that respects both a longest-side and a pixel-count limit, never upscaling."""
+    scale = 1.0
+    if max_side:
+        scale = min(scale, max_side / max(height, width))
+    if max_pixels:
+        scale = min(scale, (max_pixels / (height * width)) ** 0.5)
+    return max(1, round(height * scale)), max(1, round(width * scale))
 
-def encode_image(img) -> tuple[str, str]:
+
+def tile(arr: np.ndarray, n: int) -> list[np.ndarray]:
+    """Split *arr* into an n x n grid of crop views."""
+    ys = np.linspace(0, arr.shape[0], n + 1, dtype=int)
+    xs = np.linspace(0, arr.shape[1], n + 1, dtype=int)
+    return [arr[y0:y1, x0:x1] for y0, y1 in zip(ys, ys[1:]) for x0, x1 in zip(xs, xs[1:])]
+
+
+def as_array(img) -> np.ndarray:
     arr = np.array(img.convert("RGB")) if isinstance(img, Image.Image) else img
     if not isinstance(arr, np.ndarray):
         raise ValueError("Unsupported image type")
-    ok, buf = cv2.imencode('.jpg', cv2.cvtColor(arr, cv2.COLOR_RGB2BGR))
-    if not ok:
-        raise ValueError("Encoding failed")
-    b64 = base64.b64encode(buf).decode('utf-8')
-    return b64, "image/jpeg"
\ No newline at end of file
+    return arr
+
+
+# Encoded payloads shared by every tool, keyed by frame identity and encoding
+encoded_cache = LRUCache(max_bytes=env.encode_cache_mb * 2**20, sizeof=lambda e: e.nbytes)
+
+
+def encode_frame(img, key: Optional[Hashable] = None, profile: Profile = PROFILES["default"], max_pixels: int = 0) -> Encoded:
+    """JPEG-encode an RGB frame under *profile*, reusing the cached payload when *key* identifies it."""
+    arr = as_array(img)
+    height, width = fit(arr.shape[0], arr.shape[1], profile.max_side, max_pixels)
+
+    def _encode() -> Encoded:
+        src = arr if (height, width) == arr.shape[:2] else cv2.resize(arr, (width, height), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', cv2.cvtColor(src, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, profile.quality])
+        if not ok:
+            raise ValueError("Encoding failed")
+        return Encoded(buf.tobytes(), "image/jpeg")
+
+    cache_key = None if key is None else (key, '.jpg', arr.shape, height, width, profile.quality)
+    return encoded_cache.get_or_put(cache_key, _encode)
+
+
+def encode_frames(img, key: Optional[Hashable] = None, profile: Profile = PROFILES["default"], max_pixels: int = 0) -> list[Encoded]:
+    """The encoded frame, followed by its crops when *profile* is tiled."""
+    encoded = [encode_frame(img, key, profile, max_pixels)]
+    if profile.tiles > 1:
+        crop_profile = replace(profile, max_side=0, tiles=1)
+        for i, crop in enumerate(tile(as_array(img), profile.tiles)):
+            crop_key = None if key is None else (key, 'tile', profile.tiles, i)
+            encoded.append(encode_frame(crop, crop_key, crop_profile, max_pixels))
+    return encoded
+
+
+def mosaic(frames: list, labels: list[str], grid: tuple[int, int], tile_side: int) -> np.ndarray:
+    """Tile up to cols x rows frames row-major onto one canvas, each stamped with its label."""
+    cols, rows = grid
+    h, w = frames[0].shape[:2]
+    th, tw = fit(h, w, tile_side)
+    rows = min(rows, -(-len(frames) // cols))
+    canvas = np.zeros((rows * th, cols * tw, 3), dtype=np.uint8)
+    for i, (frame, label) in enumerate(zip(frames, labels)):
+        y, x = (i // cols) * th, (i % cols) * tw
+        canvas[y:y + th, x:x + tw] = cv2.resize(as_array(frame), (tw, th), interpolation=cv2.INTER_AREA)
+        for color, thickness in (((0, 0, 0), 3), ((255, 255, 255), 1)):
+            cv2.putText(canvas, label, (x + 6, y + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, thickness, cv2.LINE_AA)
+    return canvas
+
+
+def encode_mosaics(frames: list, keys: list, stamps: list, profile: Profile = PROFILES["default"], max_pixels: int = 0) -> list[Encoded]:
+    """Encode *frames* as timestamped mosaics of ``env.mosaic_grid`` tiles each."""
+    cols, rows = env.mosaic_grid
+    labels = [datetime.fromtimestamp(t).strftime("%H:%M:%S.%f")[:-5] if t else f"#{i}" for i, t in enumerate(stamps)]
+    profile = replace(profile, max_side=0, tiles=1)
+    encoded = []
+    for start in range(0, len(frames), cols * rows):
+        chunk = slice(start, start + cols * rows)
+        key = None if None in keys[chunk] else (
+            "mosaic", tuple(keys[chunk]), env.mosaic_grid, env.mosaic_tile, profile.quality, max_pixels
+        )
+        encoded.append(encoded_cache.get_or_put(key, lambda: encode_frame(
+            mosaic(frames[chunk], labels[chunk], env.mosaic_grid, env.mosaic_tile), None, profile, max_pixels
+        )))
+    return encoded
+
+
+def encode_image(img, key: Optional[Hashable] = None, profile: Profile = PROFILES["default"], max_pixels: int = 0) -> tuple[str, str]:
+    encoded = encode_frame(img, key, profile, max_pixels)
+    return encoded.b64, encoded.mime
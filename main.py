@@ -9,24 +9,61 @@ from app.memory import Memory,Message
 from fastrtc import get_cloudflare_turn_credentials
 from app.agent import build_agent
 from fastrtc import get_current_context
-session_memories = {}
+from app.session import SessionManager
+from app.prefetch import prefetcher, indexer
+from app.metrics import metrics, serve as serve_metrics
+from app.runtime import runtime
+from app.limits import lang_limiter, task_limiter
+from app.resilience import resilient
+from app.cache import result_cache
+from app.utils import encoded_cache
+from app.tool import task_batcher
+from app.replay import Recorder
+
+agent = None
+
+def new_session_memory() -> Memory:
+    # One agent (and model client) shared by every session, built on first use
+    global agent
+    if agent is None:
+        agent = build_agent()
+    mem = Memory(agent)
+    if env.record_dir:
+        mem.recorder = Recorder.for_session(env.record_dir, mem.uid)
+    welcome_message = "👋 Now I can see. Feel free to ask me about anything!"
+    mem.chat.append(Message.assistant(welcome_message))
+    return mem
+
+session_memories = SessionManager(new_session_memory)
+# Live counts shown next to the histograms on /metrics and /summary
+for name, component in [("sessions", session_memories), ("runtime", runtime), ("lang_limiter", lang_limiter),
+                        ("task_limiter", task_limiter), ("resilience", resilient), ("result_cache", result_cache),
+                        ("encoded_cache", encoded_cache), ("task_batcher", task_batcher), ("prefetch", prefetcher),
+                        ("index", indexer)]:
+    metrics.register(name, component.stats)
 
 def get_session_memory(session_id: str = None) -> Memory:
-    if session_id not in session_memories:
-        session_memories[session_id] = Memory(build_agent())
-        welcome_message = "👋 Now I can see. Feel free to ask me about anything!"
-        session_memories[session_id].chat.append(Message.assistant(welcome_message))
-    return session_memories[session_id]
+    return session_memories.get(session_id)
 
 def video_handler(frame):
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    rtcid = get_current_context().webrtc_id
+    return handle_frame(frame, get_current_context().webrtc_id)
+
+def handle_frame(frame, rtcid):
+    # One BGR camera frame of session rtcid; also driven directly by the replay harness (app/replay.py)
     mem = get_session_memory(rtcid)
-    if (s := mem.enqueue(frame)):
-        if mem.chat.history[-1].metadata.get('status') == 'pending':
-            mem.chat.history[-1] = Message.tool(s.gr, title=s.sender, status=s.status)
-        else:
-            mem.chat.append(Message.tool(s.gr, title=s.sender, status=s.status))
+    if mem.recorder is not None:
+        mem.recorder.frame(frame)
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    snapshots = mem.enqueue(frame)
+    prefetcher.observe(mem)
+    indexer.observe(mem)
+    for s in snapshots:
+        mem.show(s)
+    # Only push the chat to the client when it has changed since the last push
+    version = mem.chat.version
+    if version == mem.emitted_version:
+        return frame
+    mem.emitted_version = version
     return frame, AdditionalOutputs(mem.chat.messages, rtcid)
 
 def chat_handler(text, webrtc_state):
@@ -34,7 +71,9 @@ def chat_handler(text, webrtc_state):
         return "", [{"role": "assistant", "content": "Please start your camera first to begin the conversation."}], webrtc_state
     
     mem = get_session_memory(webrtc_state)
-    if not mem.is_running:
+    if text.strip():
+        if mem.recorder is not None:
+            mem.recorder.chat(text.strip())
         mem.receive(text.strip())
     return "", mem.chat.messages, webrtc_state
 
@@ -182,5 +221,6 @@ if __name__ == "__main__":
                     **⚠️ Important Note:**
                     All models are self-hosted. Please avoid abuse of the system.
                     """)
+    serve_metrics()
     demo.queue(default_concurrency_limit=None)
-    demo.launch()
\ No newline at end of file
+    demo.launch(allowed_paths=[env.blob_dir] if env.blob_dir else None)
\ No newline at end of file